@@ -0,0 +1,247 @@
+"""
+Anonimización de mensajes de foro antes de enviarlos a la IA.
+
+Los nombres (y sus variantes con/sin tildes, parciales y alias) se reemplazan
+por pseudónimos con un único matcher compilado por request: todas las
+variantes van a un trie que se traduce a una sola regex, con preferencia por
+la coincidencia más larga y bordes de palabra. Cada mensaje se recorre una
+sola vez, en lugar de una pasada de re.sub por variante.
+"""
+
+import re
+import unicodedata
+
+# ALIASES GLOBALES DE APOYO
+ALIASES_BASE = {
+    "matias": ["mati"],
+    "matías": ["mati"],
+    "camila": ["cami"],
+    "profesor": ["profe", "prof"],
+    "profesora": ["profe", "prof"]
+}
+
+# Mapa simple para adivinar posibles tildes faltantes o extras
+TILDES_MAP = {'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ó', 'u': 'ú'}
+TILDES_INV = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'}
+
+PSEUDONIMO_DESCONOCIDO = "Usuario_Desconocido"
+PATRON_PSEUDONIMO = re.compile(r"\bUsuario_\d+\b")
+
+_HTML = re.compile(r'<[^>]+>')
+_ESPACIOS = re.compile(r'\s+')
+
+
+# === Normalización ===
+def sin_acentos(texto):
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+def generar_variantes(texto):
+    if not texto:
+        return []
+    partes = [texto] + texto.split()
+    variantes = set()
+
+    for p in partes:
+        p = p.strip()
+        if len(p) > 2:
+            variantes.add(p)
+            variantes.add(sin_acentos(p))
+            variantes.add(p.lower())
+            variantes.add(sin_acentos(p).lower())
+
+            # Agregar variantes forzando tildes por si faltan
+            p_lower = p.lower()
+            for sin_t, con_t in TILDES_MAP.items():
+                if sin_t in p_lower:
+                    variantes.add(p_lower.replace(sin_t, con_t))
+
+            # Agregar variantes sacando tildes por si sobran
+            for con_t, sin_t in TILDES_INV.items():
+                if con_t in p_lower:
+                    variantes.add(p_lower.replace(con_t, sin_t))
+
+    return list(variantes)
+
+
+# === Matcher compilado ===
+def _patron_trie(claves):
+    """Regex equivalente a la alternancia de `claves`, factorizada como trie"""
+    trie = {}
+    for clave in claves:
+        nodo = trie
+        for ch in clave:
+            nodo = nodo.setdefault(ch, {})
+        nodo[""] = None
+
+    def _armar(nodo):
+        fin = "" in nodo
+        ramas = [re.escape(ch) + _armar(hijo) for ch, hijo in sorted(nodo.items()) if ch]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 and not fin else "(?:" + "|".join(ramas) + ")"
+        # Opcional y codicioso: primero intenta la variante más larga
+        return f"(?:{cuerpo})?" if fin else cuerpo
+
+    return _armar(trie)
+
+
+class Reemplazador:
+    """Reemplaza todas las claves de `mapa` en una sola pasada (case-insensitive)"""
+
+    def __init__(self, mapa):
+        self._mapa = mapa
+        # Igual que el reemplazo secuencial: ante claves que sólo difieren en
+        # mayúsculas gana la primera en orden de longitud descendente
+        self._claves = sorted(mapa, key=len, reverse=True)
+        self._por_minuscula = {}
+        for clave in self._claves:
+            self._por_minuscula.setdefault(clave.lower(), mapa[clave])
+        self._regex = None
+        if self._por_minuscula:
+            self._regex = re.compile(
+                r"(?<!\w)(?:" + _patron_trie(self._por_minuscula) + r")(?!\w)", re.IGNORECASE
+            )
+
+    def _resolver(self, m):
+        texto = m.group(0)
+        reemplazo = self._por_minuscula.get(texto.lower())
+        if reemplazo is not None:
+            return reemplazo
+        # Casos raros de case folding (ſ, K, ...) que lower() no normaliza igual
+        for clave in self._claves:
+            if re.fullmatch(re.escape(clave), texto, re.IGNORECASE):
+                return self._mapa[clave]
+        return texto
+
+    def reemplazar(self, texto):
+        if self._regex is None or not texto:
+            return texto
+        return self._regex.sub(self._resolver, texto)
+
+
+def detectar_fuga(texto, variantes_conocidas):
+    """Devuelve alguna variante (>3 letras) que siga apareciendo en el texto, o None"""
+    normalizadas = {}
+    for variante in variantes_conocidas:
+        if len(variante) > 3:
+            normalizadas.setdefault(sin_acentos(variante.lower()), variante)
+    if not normalizadas or not texto:
+        return None
+    patron = re.compile(_patron_trie(normalizadas))
+    m = patron.search(sin_acentos(texto.lower()))
+    return normalizadas.get(m.group(0)) if m else None
+
+
+def desanonimizar(texto, mapa_inverso):
+    if not texto or not mapa_inverso:
+        return texto
+    return PATRON_PSEUDONIMO.sub(lambda m: mapa_inverso.get(m.group(0), m.group(0)), texto)
+
+
+class DesanonimizadorIncremental:
+    """
+    Desanonimiza texto que llega de a fragmentos (streaming). Se retiene la
+    última palabra del buffer hasta ver un separador, así un pseudónimo
+    partido entre dos fragmentos ("Usuar" + "io_12") se restaura igual.
+    """
+
+    _COLA = re.compile(r"\w*\Z")
+
+    def __init__(self, mapa_inverso):
+        self.mapa_inverso = mapa_inverso
+        self._buffer = ""
+
+    def agregar(self, fragmento):
+        self._buffer += fragmento
+        corte = self._COLA.search(self._buffer).start()
+        listo, self._buffer = self._buffer[:corte], self._buffer[corte:]
+        return desanonimizar(listo, self.mapa_inverso)
+
+    def cerrar(self):
+        resto, self._buffer = self._buffer, ""
+        return desanonimizar(resto, self.mapa_inverso)
+
+
+# === Anonimización de hilos ===
+def anonimizar_hilos(mensajes, query_sql=""):
+    """
+    Devuelve (hilos, mapa_inverso, variantes):
+    - hilos: {hilo_id: [líneas anonimizadas en orden cronológico]}
+    - mapa_inverso: {pseudónimo: nombre real}
+    - variantes: todas las variantes de nombres reemplazadas
+    """
+    hilos = {}
+    mapa_reemplazos = {}
+    mapa_inverso = {}
+    pseudonimo_de_autor = {}
+
+    # 1. ORDEN CRONOLÓGICO DINÁMICO
+    if "DESC" in (query_sql or "").upper():
+        mensajes_cronologicos = list(reversed(mensajes))
+    else:
+        mensajes_cronologicos = list(mensajes)
+
+    # 2. GENERAR MAPA DE USUARIOS CON PSEUDÓNIMO Y VARIANTES DINÁMICAS
+    variantes_generadas = set()
+    for m in mensajes_cronologicos:
+        firstname = (m.get('firstname') or '').strip()
+        lastname = (m.get('lastname') or '').strip()
+        autor_real = f"{firstname} {lastname}".strip()
+
+        if autor_real and autor_real not in pseudonimo_de_autor:
+            # Pseudónimo por orden de aparición: mismo foro -> mismo texto anonimizado (cacheable)
+            pseudonimo = f"Usuario_{len(pseudonimo_de_autor) + 1}"
+            pseudonimo_de_autor[autor_real] = pseudonimo
+
+            variantes_usuario = generar_variantes(firstname) + generar_variantes(lastname) + generar_variantes(autor_real)
+
+            fname_lower = sin_acentos(firstname.lower())
+            if fname_lower in ALIASES_BASE:
+                variantes_usuario.extend(ALIASES_BASE[fname_lower])
+
+            for v in sorted(set(variantes_usuario)):
+                if v and v not in mapa_reemplazos:
+                    mapa_reemplazos[v] = pseudonimo
+                    variantes_generadas.add(v)
+
+            mapa_inverso[pseudonimo] = autor_real
+
+    reemplazador = Reemplazador(mapa_reemplazos)
+
+    # 3. CONSTRUIR HILOS, LIMPIEZA HTML Y REEMPLAZO EN UNA PASADA
+    for m in mensajes_cronologicos:
+        if not m.get('message'):
+            continue
+
+        hilo_id = m.get('discusion_id') or m.get('tema') or 'General'
+        lineas = hilos.setdefault(hilo_id, [])
+
+        autor_real = f"{(m.get('firstname') or '').strip()} {(m.get('lastname') or '').strip()}".strip()
+        pseudonimo = pseudonimo_de_autor.get(autor_real) or PSEUDONIMO_DESCONOCIDO
+
+        # PASO 1 — LIMPIAR SÓLO HTML Y ESPACIOS MÚLTIPLES (Preservamos puntuación)
+        texto = _HTML.sub(' ', m.get('message', '').strip())
+        texto = _ESPACIOS.sub(' ', texto).strip()
+
+        # PASO 2 — REEMPLAZO (coincidencia más larga primero)
+        texto = reemplazador.reemplazar(texto)
+
+        # Armamos un bloque con la info que tengamos disponible
+        meta_info = []
+        if m.get('fecha'): meta_info.append(f"Fecha: {m.get('fecha')}")
+        if m.get('curso'): meta_info.append(f"Curso: {m.get('curso')}")
+        if m.get('foro'): meta_info.append(f"Foro: {m.get('foro')}")
+
+        meta_str = f" [{ ' | '.join(meta_info) }]" if meta_info else ""
+
+        lineas.append(f"-{meta_str} {pseudonimo}: {texto}")
+
+    return hilos, mapa_inverso, variantes_generadas
+
+
+def formatear_hilo(hilo_id, lineas):
+    return f"--- HILO DE CONVERSACIÓN: {hilo_id} (Mensajes en orden cronológico) ---\n" + "\n".join(lineas)
+
+
+def unir_hilos(hilos):
+    return "\n\n".join(formatear_hilo(hilo_id, lineas) for hilo_id, lineas in hilos.items())
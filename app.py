@@ -1,9 +1,27 @@
 import os
-from flask import Flask
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path="/home/asistenteia/.env")
+
+# === Modo asíncrono (gevent) ===
+# Debe ir antes de importar Flask, MySQL u OpenAI para que sus sockets sean cooperativos.
+# Con Gunicorn el worker gevent ya parchea; esto cubre el modo local (python app.py).
+if os.getenv("ASYNC_MODE", "").lower() == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, request, abort
+
+from recursos import medir, imprimir_informe
 
 # === Importación de Blueprints necesarios ===
-from foro import foro_bp
-from curso import curso_bp
+with medir("import foro"):
+    from foro import foro_bp
+with medir("import curso"):
+    from curso import curso_bp
+from compresion import comprimir_respuesta
+from db import PoolAgotado, respuesta_agotado
+import trazas
 
 # === Inicialización ===
 app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -13,9 +31,30 @@ app.secret_key = "unaClaveMuySegura123"
 app.register_blueprint(foro_bp, url_prefix='/foro')
 app.register_blueprint(curso_bp, url_prefix='/curso')
 
+# === Sin conexiones libres a la base: 503 con Retry-After ===
+app.register_error_handler(PoolAgotado, respuesta_agotado)
+
+# === Compresión gzip/brotli según Accept-Encoding ===
+app.after_request(comprimir_respuesta)
+
+# === Trazas por etapa (Server-Timing) ===
+# Flask corre los after_request en orden inverso: las trazas van antes de comprimir
+app.before_request(trazas.iniciar_peticion)
+app.after_request(trazas.cerrar_peticion)
+
+# === Métricas en formato Prometheus (siempre con clave) ===
+# Detrás de Nginx todas las requests llegan desde localhost: remote_addr no sirve para autorizar
+@app.route("/metrics")
+def metrics():
+    if request.headers.get("x-pass") != os.getenv("ACCESS_KEY", "2817"):
+        abort(403)
+    return Response(trazas.texto_prometheus(), mimetype="text/plain; version=0.0.4")
+
 # === Export para Gunicorn ===
 application = app
 
+imprimir_informe()
+
 # === Modo local (debug) con host 0.0.0.0 para acceso externo ===
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,192 @@
+"""
+Registro de auditoría asíncrono (interacciones.log en JSON lines).
+
+Las requests sólo encolan el registro; un hilo por worker los escribe en
+lotes, con fsync como mucho una vez por AUDITORIA_FSYNC segundos. La cola es
+acotada: si se llena, el registro se descarta (y se cuenta) en lugar de
+frenar la request.
+
+Varios workers escriben el mismo archivo: cada lote se escribe bajo un flock
+sobre `<archivo>.lock`, así las líneas nunca se intercalan y la rotación
+(por tamaño o antigüedad) la hace un solo proceso a la vez. Los archivos
+rotados se comprimen con gzip y se conservan los últimos AUDITORIA_CONSERVAR.
+"""
+
+import os
+import gzip
+import glob
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # sin flock (Windows): un solo proceso escribiendo
+    fcntl = None
+
+
+class RegistroAuditoria:
+    def __init__(self, ruta, max_cola=10000, lote=256, intervalo_fsync=1.0,
+                 max_bytes=50 * 1024 * 1024, max_horas=24.0, conservar=10):
+        self.ruta = ruta
+        self.max_cola = max_cola
+        self.lote = lote
+        self.intervalo_fsync = intervalo_fsync
+        self.max_bytes = max_bytes
+        self.max_horas = max_horas
+        self.conservar = conservar
+        self._pid = None
+        self._cola = None
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._inicio_por_inodo = {}
+        self.escritos = 0
+        self.descartados = 0
+        self.errores = 0
+        self.rotaciones = 0
+        atexit.register(self.cerrar)
+
+    # --- Productores ---
+    def _asegurar_hilo(self):
+        # Después de un fork el hilo del padre no existe en el hijo
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._cola = queue.Queue(maxsize=self.max_cola)
+            self._hilo = threading.Thread(target=self._bucle, name="auditoria", daemon=True)
+            self._hilo.start()
+            self._pid = os.getpid()
+
+    def registrar(self, tipo, **campos):
+        self._asegurar_hilo()
+        registro = {"ts": datetime.now().isoformat(timespec="milliseconds"), "tipo": tipo,
+                    "pid": os.getpid(), **campos}
+        try:
+            self._cola.put_nowait(registro)
+        except queue.Full:
+            self.descartados += 1
+
+    # --- Escritor ---
+    def _bucle(self):
+        cola = self._cola
+        pendiente_fsync = False
+        ultimo_fsync = time.monotonic()
+        while True:
+            try:
+                primero = cola.get(timeout=self.intervalo_fsync)
+            except queue.Empty:
+                primero = None
+            lote = [] if primero is None else [primero]
+            while len(lote) < self.lote:
+                try:
+                    lote.append(cola.get_nowait())
+                except queue.Empty:
+                    break
+            if None in lote:
+                # Señal de cierre
+                lote = [r for r in lote if r is not None]
+                self._escribir(lote, fsync=True)
+                return
+            ahora = time.monotonic()
+            fsync = (lote or pendiente_fsync) and ahora - ultimo_fsync >= self.intervalo_fsync
+            if lote or fsync:
+                self._escribir(lote, fsync)
+            if fsync:
+                ultimo_fsync = ahora
+                pendiente_fsync = False
+            elif lote:
+                pendiente_fsync = True
+
+    def _escribir(self, lote, fsync):
+        lineas = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in lote)
+        rotado = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            with open(f"{self.ruta}.lock", "a") as candado:
+                if fcntl is not None:
+                    fcntl.flock(candado, fcntl.LOCK_EX)
+                try:
+                    rotado = self._rotar_si_corresponde()
+                    with open(self.ruta, "a", encoding="utf-8") as f:
+                        if lineas:
+                            f.write(lineas)
+                            f.flush()
+                        if fsync:
+                            os.fsync(f.fileno())
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(candado, fcntl.LOCK_UN)
+            self.escritos += len(lote)
+        except Exception as e:
+            self.errores += 1
+            print(f"⚠️ No se pudo escribir la auditoría: {e}")
+        if rotado:
+            # Fuera del lock: comprimir no frena a los otros workers
+            self._comprimir(rotado)
+
+    # --- Rotación ---
+    def _inicio(self, st):
+        """Fecha del primer registro del archivo actual (cacheada por inodo)"""
+        inicio = self._inicio_por_inodo.get(st.st_ino)
+        if inicio is None:
+            try:
+                with open(self.ruta, encoding="utf-8") as f:
+                    inicio = datetime.fromisoformat(json.loads(f.readline())["ts"]).timestamp()
+            except Exception:
+                # Archivo viejo (texto plano) o vacío: cuenta desde su última modificación
+                inicio = st.st_mtime
+            self._inicio_por_inodo = {st.st_ino: inicio}
+        return inicio
+
+    def _rotar_si_corresponde(self):
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        por_tamano = self.max_bytes and st.st_size >= self.max_bytes
+        por_edad = self.max_horas and time.time() - self._inicio(st) >= self.max_horas * 3600
+        if not (por_tamano or por_edad):
+            return None
+        destino = f"{self.ruta}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{os.getpid()}"
+        os.replace(self.ruta, destino)
+        self.rotaciones += 1
+        return destino
+
+    def _comprimir(self, ruta):
+        try:
+            with open(ruta, "rb") as origen, gzip.open(f"{ruta}.gz", "wb") as destino:
+                shutil.copyfileobj(origen, destino)
+            os.remove(ruta)
+            viejos = sorted(glob.glob(f"{glob.escape(self.ruta)}.*.gz"))
+            for viejo in viejos[:-self.conservar] if self.conservar else []:
+                os.remove(viejo)
+        except OSError as e:
+            print(f"⚠️ No se pudo comprimir {ruta}: {e}")
+
+    # --- Cierre y métricas ---
+    def cerrar(self, timeout=5.0):
+        """Vacía la cola (atexit); no bloquea más de `timeout` segundos"""
+        if self._pid != os.getpid() or self._hilo is None:
+            return
+        try:
+            self._cola.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._hilo.join(timeout)
+
+    def estadisticas(self):
+        return {
+            "en_cola": self._cola.qsize() if self._cola is not None and self._pid == os.getpid() else 0,
+            "escritos": self.escritos,
+            "descartados": self.descartados,
+            "errores": self.errores,
+            "rotaciones": self.rotaciones,
+        }
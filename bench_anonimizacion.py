@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark del anonimizador sobre foros sintéticos.
+
+Compara el matcher compilado (trie -> regex, una pasada por mensaje) contra
+el reemplazo secuencial anterior (un re.sub por variante y por mensaje) y
+verifica que ambos produzcan el mismo texto.
+
+Uso:
+    python bench_anonimizacion.py --posts 10000 --usuarios 500 --muestra-legacy 50
+"""
+
+import re
+import time
+import random
+import argparse
+
+from anonimizador import Reemplazador, anonimizar_hilos, generar_variantes, ALIASES_BASE, sin_acentos
+
+NOMBRES = [
+    "Matías", "Camila", "Juan", "María", "José", "Lucía", "Sofía", "Martín", "Agustín", "Valentina",
+    "Julián", "Florencia", "Tomás", "Rocío", "Nicolás", "Ana", "Belén", "Joaquín", "Ramón", "Inés",
+]
+APELLIDOS = [
+    "Pérez", "Gómez", "Fernández", "López", "Martínez", "Rodríguez", "Sánchez", "Díaz", "Álvarez",
+    "Romero", "Suárez", "Benítez", "Acosta", "Medina", "Herrera", "Aguirre", "Giménez", "Ríos",
+]
+PALABRAS = (
+    "hola buenas tardes consulta sobre el trabajo práctico entrega fecha clase martes gracias "
+    "profe no entiendo la consigna del foro alguien sabe cuando es el parcial saludos"
+).split()
+
+
+def generar_foro(posts, usuarios, semilla=42):
+    rnd = random.Random(semilla)
+    personas = []
+    vistos = set()
+    while len(personas) < usuarios:
+        nombre = rnd.choice(NOMBRES)
+        apellido = f"{rnd.choice(APELLIDOS)}{len(personas) // len(APELLIDOS) or ''}"
+        if (nombre, apellido) not in vistos:
+            vistos.add((nombre, apellido))
+            personas.append((nombre, apellido))
+
+    mensajes = []
+    for i in range(posts):
+        nombre, apellido = rnd.choice(personas)
+        texto = [rnd.choice(PALABRAS) for _ in range(rnd.randint(15, 60))]
+        for _ in range(rnd.randint(0, 3)):
+            otro = rnd.choice(personas)
+            mencion = rnd.choice([otro[0], otro[0].lower(), sin_acentos(otro[0]), f"{otro[0]} {otro[1]}"])
+            texto.insert(rnd.randrange(len(texto)), mencion)
+        mensajes.append({
+            "firstname": nombre,
+            "lastname": apellido,
+            "message": "<p>" + " ".join(texto) + "</p>",
+            "tema": f"Tema {i % 40}",
+        })
+    return mensajes
+
+
+def mapa_de_reemplazos(mensajes):
+    """Mismo mapa variante -> pseudónimo que arma anonimizar_hilos"""
+    mapa, autores = {}, {}
+    for m in mensajes:
+        nombre, apellido = m["firstname"], m["lastname"]
+        autor = f"{nombre} {apellido}".strip()
+        if autor in autores:
+            continue
+        pseudo = f"Usuario_{len(autores) + 1}"
+        autores[autor] = pseudo
+        variantes = generar_variantes(nombre) + generar_variantes(apellido) + generar_variantes(autor)
+        variantes.extend(ALIASES_BASE.get(sin_acentos(nombre.lower()), []))
+        for v in sorted(set(variantes)):
+            if v and v not in mapa:
+                mapa[v] = pseudo
+    return mapa
+
+
+def reemplazo_secuencial(texto, mapa):
+    """Implementación anterior: un re.sub por variante, de la más larga a la más corta"""
+    for nombre_real in sorted(mapa.keys(), key=len, reverse=True):
+        patron = r'(?i)(?<!\w)' + re.escape(nombre_real) + r'(?!\w)'
+        texto = re.sub(patron, mapa[nombre_real], texto)
+    return texto
+
+
+def limpiar(texto):
+    texto = re.sub(r'<[^>]+>', ' ', texto)
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--muestra-legacy", type=int, default=50,
+                        help="mensajes a procesar con el método secuencial (es muy lento)")
+    args = parser.parse_args()
+
+    mensajes = generar_foro(args.posts, args.usuarios)
+    mapa = mapa_de_reemplazos(mensajes)
+    print(f"Foro sintético: {len(mensajes)} mensajes, {args.usuarios} usuarios, {len(mapa)} variantes")
+
+    t0 = time.perf_counter()
+    reemplazador = Reemplazador(mapa)
+    t_compilar = time.perf_counter() - t0
+
+    textos = [limpiar(m["message"]) for m in mensajes]
+    t0 = time.perf_counter()
+    nuevos = [reemplazador.reemplazar(t) for t in textos]
+    t_nuevo = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    anonimizar_hilos(mensajes)
+    t_total = time.perf_counter() - t0
+
+    muestra = textos[:args.muestra_legacy]
+    t0 = time.perf_counter()
+    viejos = [reemplazo_secuencial(t, mapa) for t in muestra]
+    t_viejo = time.perf_counter() - t0
+    t_viejo_estimado = t_viejo * len(textos) / max(1, len(muestra))
+
+    distintos = sum(1 for a, b in zip(viejos, nuevos) if a != b)
+
+    print(f"Compilación del matcher:           {t_compilar * 1000:9.1f} ms")
+    print(f"Reemplazo compilado ({len(textos)} msjs):   {t_nuevo * 1000:9.1f} ms")
+    print(f"anonimizar_hilos completo:         {t_total * 1000:9.1f} ms")
+    print(f"Secuencial ({len(muestra)} msjs):           {t_viejo * 1000:9.1f} ms "
+          f"(≈ {t_viejo_estimado:.1f} s estimados para {len(textos)})")
+    print(f"Aceleración estimada:              {t_viejo_estimado / max(t_nuevo + t_compilar, 1e-9):9.1f}x")
+    print(f"Diferencias en la muestra:         {distintos} / {len(muestra)}")
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark de backends del modelo de embeddings sobre las preguntas del catálogo.
+
+Cada backend corre en un proceso aparte (RSS limpio) y se compara contra
+torch: tiempo de carga, RSS, latencia de una consulta (p50/p95) y del lote
+completo, similitud coseno entre vectores y coincidencia del top-k al buscar
+cada pregunta contra el resto del catálogo.
+
+Sale con código 1 si algún vector queda por debajo de la tolerancia.
+
+Uso:
+    python bench_embeddings.py --backend onnx --tolerancia 0.98 --top-k 5
+"""
+
+import os
+import time
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+from catalogo import Catalogo
+from embeddings import BACKENDS, ARCHIVO_ONNX_DEFECTO, cargar_modelo
+
+MODELO = "paraphrase-multilingual-MiniLM-L12-v2"
+BASE = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _correr(backend, archivo, textos, repeticiones, salida):
+    rss_inicial = rss_mb()
+    t0 = time.perf_counter()
+    modelo = cargar_modelo(MODELO, backend, archivo)
+    t_carga = time.perf_counter() - t0
+
+    codificar = lambda x: modelo.encode(x, convert_to_numpy=True, normalize_embeddings=True)
+    codificar(textos[:2])  # calentamiento
+
+    latencias = []
+    for i in range(repeticiones):
+        t0 = time.perf_counter()
+        codificar([textos[i % len(textos)]])
+        latencias.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    vectores = np.asarray(codificar(textos), dtype=np.float32)
+    t_lote = time.perf_counter() - t0
+
+    salida.put({
+        "carga": t_carga,
+        "rss": rss_mb() - rss_inicial,
+        "p50": float(np.percentile(latencias, 50)),
+        "p95": float(np.percentile(latencias, 95)),
+        "lote": t_lote,
+        "vectores": vectores,
+    })
+
+
+def medir_backend(backend, archivo, textos, repeticiones):
+    ctx = mp.get_context("spawn")
+    salida = ctx.Queue()
+    proceso = ctx.Process(target=_correr, args=(backend, archivo, textos, repeticiones, salida))
+    proceso.start()
+    resultado = salida.get()
+    proceso.join()
+    return resultado
+
+
+def top_k(vectores, k):
+    sims = vectores @ vectores.T
+    np.fill_diagonal(sims, -np.inf)
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    parser.add_argument("--archivo", default=ARCHIVO_ONNX_DEFECTO, help="export ONNX dentro del repo del modelo")
+    parser.add_argument("--tolerancia", type=float, default=float(os.getenv("EMBED_TOLERANCIA", "0.98")),
+                        help="similitud coseno mínima contra torch para cada pregunta")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    catalogo = Catalogo([os.path.join(BASE, "sql_base.json"), os.path.join(BASE, "sql_ejemplos.json")])
+    textos = list(dict.fromkeys(p.get("pregunta", "") for p in catalogo.snapshot().todas() if p.get("pregunta")))
+    print(f"Catálogo: {len(textos)} preguntas")
+
+    referencia = medir_backend("torch", None, textos, args.repeticiones)
+    candidato = medir_backend(args.backend, args.archivo, textos, args.repeticiones)
+
+    cos = np.sum(referencia["vectores"] * candidato["vectores"], axis=1)
+    k = min(args.top_k, len(textos) - 1)
+    vecinos_ref = top_k(referencia["vectores"], k)
+    vecinos_cand = top_k(candidato["vectores"], k)
+    coincidencia = np.mean([len(set(a) & set(b)) / k for a, b in zip(vecinos_ref, vecinos_cand)])
+    primero_igual = np.mean(vecinos_ref[:, 0] == vecinos_cand[:, 0])
+
+    nombre = f"{args.backend} ({args.archivo})"
+    print(f"{'':22}{'torch':>14}{args.backend:>14}")
+    for clave, etiqueta, escala, unidad in (
+        ("carga", "Carga del modelo", 1, "s"),
+        ("rss", "RSS", 1, "MB"),
+        ("p50", "Consulta p50", 1000, "ms"),
+        ("p95", "Consulta p95", 1000, "ms"),
+        ("lote", f"Lote ({len(textos)})", 1000, "ms"),
+    ):
+        print(f"{etiqueta:22}{referencia[clave] * escala:11.2f} {unidad:2}{candidato[clave] * escala:11.2f} {unidad:2}")
+    print(f"Backend evaluado:     {nombre}")
+    print(f"Coseno vs torch:      mín {cos.min():.4f} · medio {cos.mean():.4f} (tolerancia {args.tolerancia})")
+    print(f"Top-{k} coincidente:    {coincidencia * 100:.1f}% · top-1 igual {primero_igual * 100:.1f}%")
+
+    fuera = int(np.sum(cos < args.tolerancia))
+    if fuera:
+        print(f"❌ {fuera} preguntas por debajo de la tolerancia")
+        return 1
+    print("✅ Dentro de la tolerancia")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
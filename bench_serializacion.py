@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serializar_resultado.
+
+Compara el plan de columnas precompilado (por filas y por columnas) contra la
+implementación anterior, que decidía renombrado y conversión celda por celda,
+y verifica que ambas produzcan la misma salida.
+
+Uso:
+    python bench_serializacion.py --filas 1000 --repeticiones 200
+"""
+
+import time
+import random
+import argparse
+from decimal import Decimal
+from datetime import datetime
+
+import serializacion
+from serializacion import MODULO_TRAD, TRADUCCION_COLUMNAS, serializar_resultado
+
+# (columna, código de tipo MySQL) como en cursor.description
+DESCRIPCION = (
+    ("id", 8), ("firstname", 253), ("lastname", 253), ("count(fp.id)", 246),
+    ("ultima_conexion", 8), ("tipo_recurso", 253), ("promedio", 246), ("created", 12),
+)
+
+
+def serializar_legacy(data):
+    """Implementación anterior: isinstance + búsquedas de claves por celda"""
+    resultado = []
+    for fila in data:
+        nueva = {}
+        for k, v in fila.items():
+            key = "cantidad" if isinstance(k, str) and "count" in k.lower() else k
+            if isinstance(v, Decimal):
+                v = float(v)
+            if isinstance(v, (int, float)) and isinstance(key, str) and any(
+                t in key.lower() for t in ["fecha", "time", "conexion", "due", "duedate", "created"]
+            ):
+                try:
+                    v = datetime.fromtimestamp(v).strftime("%d/%m/%Y %H:%M")
+                except Exception:
+                    pass
+            elif isinstance(v, datetime):
+                v = v.strftime("%d/%m/%Y %H:%M")
+            key_esp = TRADUCCION_COLUMNAS.get(key, key)
+            if key_esp == "Tipo de recurso":
+                v = MODULO_TRAD.get(str(v).lower(), v)
+            nueva[key_esp] = v
+        resultado.append(nueva)
+    return resultado
+
+
+def generar_filas(n, semilla=42):
+    rnd = random.Random(semilla)
+    return [{
+        "id": i,
+        "firstname": rnd.choice(["Ana", "Juan", "Lucía", "Tomás"]),
+        "lastname": rnd.choice(["Pérez", "Gómez", "Ríos"]),
+        "count(fp.id)": Decimal(rnd.randint(0, 50)),
+        "ultima_conexion": rnd.choice([1700000000 + rnd.randint(0, 10 ** 7), None]),
+        "tipo_recurso": rnd.choice(["forum", "assign", "resource", "quiz", "page"]),
+        "promedio": Decimal(f"{rnd.uniform(1, 10):.2f}"),
+        "created": datetime(2024, 1, 1, rnd.randint(0, 23), rnd.randint(0, 59)),
+    } for i in range(n)]
+
+
+def medir(funcion, repeticiones):
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        salida = funcion()
+    return (time.perf_counter() - t0) / repeticiones, salida
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    filas = generar_filas(args.filas)
+    print(f"Resultado sintético: {len(filas)} filas x {len(DESCRIPCION)} columnas")
+
+    t_legacy, esperado = medir(lambda: serializar_legacy(filas), args.repeticiones)
+    t_plan, con_nombres = medir(lambda: serializar_resultado(filas), args.repeticiones)
+    t_tipos, con_tipos = medir(lambda: serializar_resultado(filas, DESCRIPCION), args.repeticiones)
+
+    umbral = serializacion.UMBRAL_COLUMNAR
+    serializacion.UMBRAL_COLUMNAR = float("inf")
+    try:
+        t_filas, por_filas = medir(lambda: serializar_resultado(filas, DESCRIPCION), args.repeticiones)
+    finally:
+        serializacion.UMBRAL_COLUMNAR = umbral
+
+    distintos = sum(salida != esperado for salida in (con_nombres, con_tipos, por_filas))
+
+    print(f"Anterior (celda por celda):        {t_legacy * 1000:8.2f} ms")
+    print(f"Plan por nombres:                  {t_plan * 1000:8.2f} ms  ({t_legacy / t_plan:4.1f}x)")
+    print(f"Plan con tipos, por filas:         {t_filas * 1000:8.2f} ms  ({t_legacy / t_filas:4.1f}x)")
+    print(f"Plan con tipos, por columnas:      {t_tipos * 1000:8.2f} ms  ({t_legacy / t_tipos:4.1f}x)")
+    print(f"Salidas distintas a la anterior:   {distintos}")
+    return 1 if distintos else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
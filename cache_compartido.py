@@ -0,0 +1,149 @@
+"""
+Cache compartido entre workers con stale-while-revalidate.
+
+El valor vive en un archivo JSON (CACHE_DIR) que leen todos los workers; cada
+uno guarda una copia en memoria y sólo relee el archivo cuando cambia su
+mtime. Vencido el TTL se sigue sirviendo el valor viejo mientras un único
+refresco corre en segundo plano: un hilo por worker y, entre workers, un
+flock no bloqueante sobre `<archivo>.lock` (si otro worker ya refresca, no se
+repite la consulta). Sólo se espera al refresco cuando no hay valor o es más
+viejo que `max_obsoleto`.
+
+Cada valor lleva un ETag (sha1 del JSON) para responder 304 a If-None-Match.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # sin flock (Windows): cada worker refresca por su cuenta
+    fcntl = None
+
+
+class CacheNoDisponible(Exception):
+    """No hay valor cacheado y el refresco no trajo uno"""
+
+
+class CacheCompartido:
+    def __init__(self, ruta, cargar, ttl=300.0, max_obsoleto=3600.0):
+        self.ruta = ruta
+        self.cargar = cargar
+        self.ttl = ttl
+        self.max_obsoleto = max_obsoleto
+        self._valor = None   # {"ts", "etag", "datos"}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._refrescando = False
+        self.hits = 0
+        self.obsoletos = 0
+        self.refrescos = 0
+        self.errores = 0
+
+    # --- Archivo compartido ---
+    def _leer_archivo(self):
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                valor = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._valor, self._mtime = valor, mtime
+
+    def _escribir_archivo(self, valor):
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(valor, f, ensure_ascii=False)
+            os.replace(tmp, self.ruta)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar {self.ruta}: {e}")
+
+    # --- Refresco ---
+    def _refrescar(self, bloquear):
+        """Recarga el valor; con `bloquear=False` no espera si otro worker ya refresca"""
+        candado = None
+        try:
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+                candado = open(f"{self.ruta}.lock", "a")
+                try:
+                    fcntl.flock(candado, fcntl.LOCK_EX | (0 if bloquear else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    return
+                # Otro worker pudo haber refrescado mientras se esperaba el lock
+                with self._lock:
+                    self._leer_archivo()
+                    if self._valor and time.time() - self._valor["ts"] <= self.ttl:
+                        return
+
+            datos = self.cargar()
+            crudo = json.dumps(datos, ensure_ascii=False, sort_keys=True)
+            valor = {
+                "ts": time.time(),
+                "etag": hashlib.sha1(crudo.encode("utf-8")).hexdigest(),
+                "datos": datos,
+            }
+            self._escribir_archivo(valor)
+            with self._lock:
+                self._valor = valor
+                self.refrescos += 1
+        finally:
+            if candado is not None:
+                fcntl.flock(candado, fcntl.LOCK_UN)
+                candado.close()
+
+    def _refrescar_en_fondo(self):
+        try:
+            self._refrescar(bloquear=False)
+        except Exception as e:
+            # Se sigue sirviendo el valor viejo; el próximo pedido reintenta
+            self.errores += 1
+            print(f"⚠️ Falló el refresco en segundo plano de {self.ruta}: {e}")
+        finally:
+            self._refrescando = False
+
+    # --- Lectura ---
+    def obtener(self):
+        """(datos, etag); refresca en segundo plano si el valor está vencido.
+        Lanza CacheNoDisponible si no hay ningún valor para servir"""
+        with self._lock:
+            self._leer_archivo()
+            valor = self._valor
+        edad = time.time() - valor["ts"] if valor else None
+
+        if valor is None or edad > self.max_obsoleto:
+            self._refrescar(bloquear=True)
+            valor = self._valor
+            if valor is None:
+                # Arranque en frío sin archivo: otro worker tenía el lock y su refresco falló
+                raise CacheNoDisponible(f"Sin datos en {self.ruta} (el refresco falló)")
+        elif edad > self.ttl:
+            self.obsoletos += 1
+            with self._lock:
+                lanzar = not self._refrescando
+                self._refrescando = True
+            if lanzar:
+                threading.Thread(target=self._refrescar_en_fondo, name="refresco-cache", daemon=True).start()
+        else:
+            self.hits += 1
+        return valor["datos"], valor["etag"]
+
+    def estadisticas(self):
+        valor = self._valor
+        return {
+            "edad_s": round(time.time() - valor["ts"], 1) if valor else None,
+            "hits": self.hits,
+            "obsoletos": self.obsoletos,
+            "refrescos": self.refrescos,
+            "errores": self.errores,
+        }
@@ -0,0 +1,93 @@
+"""
+Memoización de los análisis IA.
+
+Primer nivel en memoria (TTLCache por worker) y segundo nivel opcional en un
+SQLite local (IA_CACHE_DB) para que los análisis sobrevivan a reinicios de
+los workers de Gunicorn y se compartan entre ellos.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+
+from cachetools import TTLCache
+
+
+def digest_analisis(*partes) -> str:
+    """Digest estable de los datos que determinan la respuesta de la IA"""
+    crudo = json.dumps(partes, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+class CacheIA:
+    def __init__(self, memoria: TTLCache, ruta_db=None):
+        self.memoria = memoria
+        self.ttl = memoria.ttl
+        self.ruta_db = ruta_db or None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.ruta_db:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.ruta_db)), exist_ok=True)
+                with closing(self._conectar()) as db, db:
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS analisis ("
+                        "clave TEXT PRIMARY KEY, valor TEXT NOT NULL, creado REAL NOT NULL)"
+                    )
+                    db.execute("DELETE FROM analisis WHERE creado < ?", (time.time() - self.ttl,))
+            except Exception as e:
+                print(f"⚠️ Cache IA en disco deshabilitado: {e}")
+                self.ruta_db = None
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta_db, timeout=5)
+
+    def obtener(self, clave):
+        with self._lock:
+            valor = self.memoria.get(clave)
+        if valor is None and self.ruta_db:
+            try:
+                with closing(self._conectar()) as db, db:
+                    fila = db.execute(
+                        "SELECT valor FROM analisis WHERE clave = ? AND creado >= ?",
+                        (clave, time.time() - self.ttl),
+                    ).fetchone()
+                if fila:
+                    valor = fila[0]
+                    with self._lock:
+                        self.memoria[clave] = valor
+            except Exception:
+                pass
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self.memoria[clave] = valor
+        if self.ruta_db:
+            try:
+                with closing(self._conectar()) as db, db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO analisis (clave, valor, creado) VALUES (?, ?, ?)",
+                        (clave, valor, time.time()),
+                    )
+            except Exception:
+                pass
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas_memoria": len(self.memoria),
+                "hits": self.hits,
+                "misses": self.misses,
+                "disco": bool(self.ruta_db),
+            }
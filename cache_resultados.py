@@ -0,0 +1,112 @@
+"""
+Cache de resultados de las consultas SQL del catálogo.
+
+LRU acotado por tamaño aproximado en bytes, con TTL por entrada y un índice
+por curso para poder invalidar todos los resultados de un curso a demanda.
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+def _estimar_bytes(filas):
+    total = sys.getsizeof(filas)
+    for fila in filas:
+        total += sys.getsizeof(fila)
+        valores = fila.values() if isinstance(fila, dict) else fila
+        for v in valores:
+            total += sys.getsizeof(v)
+    return total
+
+
+class CacheResultados:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl_defecto=60.0):
+        self.max_bytes = max_bytes
+        self.ttl_defecto = ttl_defecto
+        self._datos = OrderedDict()   # clave -> (expira, bytes, curso, filas)
+        self._por_curso = {}          # curso -> {claves}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirados = 0
+        self.desalojos = 0
+
+    @staticmethod
+    def clave(sql, params, page, size):
+        return (sql, tuple(params or ()), page, size)
+
+    def _quitar(self, clave):
+        _, tam, curso, _ = self._datos.pop(clave)
+        self._bytes -= tam
+        claves = self._por_curso.get(curso)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._por_curso[curso]
+
+    def obtener(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] < time.monotonic():
+                self._quitar(clave)
+                self.expirados += 1
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return item[3]
+
+    def guardar(self, clave, filas, ttl=None, curso=""):
+        ttl = self.ttl_defecto if ttl is None else ttl
+        if ttl <= 0:
+            return
+        filas = tuple(filas)
+        tam = _estimar_bytes(filas)
+        if tam > self.max_bytes:
+            return
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (time.monotonic() + ttl, tam, curso, filas)
+            self._por_curso.setdefault(curso, set()).add(clave)
+            self._bytes += tam
+            while self._bytes > self.max_bytes and self._datos:
+                self._quitar(next(iter(self._datos)))
+                self.desalojos += 1
+
+    def invalidar_curso(self, curso):
+        """Elimina todos los resultados de un curso; devuelve cuántos se borraron"""
+        with self._lock:
+            claves = list(self._por_curso.get(curso, ()))
+            for clave in claves:
+                self._quitar(clave)
+            return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            n = len(self._datos)
+            self._datos.clear()
+            self._por_curso.clear()
+            self._bytes = 0
+            return n
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+                "expirados": self.expirados,
+                "desalojos": self.desalojos,
+                "cursos": len(self._por_curso),
+            }
@@ -0,0 +1,141 @@
+"""
+Catálogo de preguntas (sql_base.json + sql_ejemplos.json) en memoria.
+
+Se parsea una sola vez por worker y se recarga sólo cuando cambian los
+archivos (mtime/inode/tamaño). Cada recarga arma un snapshot inmutable que
+se publica con un simple reemplazo de referencia, así las requests en curso
+siguen usando el snapshot que tomaron. Con `compilar`, la SQL de cada entrada
+se precompila al armar el snapshot (ver plantilla_sql.py).
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from types import MappingProxyType
+
+CLAVES = ("generales", "por_curso", "generales_ia", "por_curso_ia")
+
+
+class SnapshotCatalogo:
+    __slots__ = ("version", "buckets", "generales", "por_curso", "por_sql", "por_pregunta", "plantillas",
+                 "faq", "firmas")
+
+    def __init__(self, version, buckets, faq, firmas, compilar=None):
+        self.version = version
+        self.buckets = MappingProxyType({k: tuple(buckets.get(k, ())) for k in CLAVES})
+        # Listas ya combinadas que usa el hot path
+        self.generales = self.buckets["generales"] + self.buckets["generales_ia"]
+        self.por_curso = self.buckets["por_curso"] + self.buckets["por_curso_ia"]
+        # Entrada del catálogo a partir de su SQL (para /foro/chat, que recibe la SQL elegida)
+        self.por_sql = MappingProxyType({
+            p["sql"].strip(): p for p in self.todas() if isinstance(p.get("sql"), str)
+        })
+        # Entrada a partir del texto exacto de la pregunta (para /foro/tablero)
+        self.por_pregunta = MappingProxyType({
+            p["pregunta"]: p for p in self.todas() if isinstance(p.get("pregunta"), str)
+        })
+        self.plantillas = MappingProxyType(
+            {sql: compilar(p) for sql, p in self.por_sql.items()} if compilar else {}
+        )
+        self.faq = MappingProxyType(faq)
+        self.firmas = firmas
+
+    def preguntas_para(self, con_curso: bool):
+        return self.por_curso if con_curso else self.generales
+
+    def entrada_por_sql(self, sql):
+        return self.por_sql.get((sql or "").strip())
+
+    def entrada_por_pregunta(self, pregunta):
+        return self.por_pregunta.get((pregunta or "").strip())
+
+    def plantilla_por_sql(self, sql):
+        return self.plantillas.get((sql or "").strip())
+
+    def todas(self):
+        for clave in CLAVES:
+            yield from self.buckets[clave]
+
+
+class Catalogo:
+    def __init__(self, archivos, intervalo=1.0, compilar=None):
+        self.archivos = list(archivos)
+        self.intervalo = intervalo
+        self.compilar = compilar
+        self._snapshot = None
+        self._ultimo_chequeo = 0.0
+        self._lock = threading.Lock()
+
+    def _firmas(self):
+        firmas = []
+        for archivo in self.archivos:
+            try:
+                st = os.stat(archivo)
+                firmas.append((archivo, st.st_mtime_ns, st.st_ino, st.st_size))
+            except OSError:
+                firmas.append((archivo, None, None, None))
+        return tuple(firmas)
+
+    def _cargar(self, firmas, anterior):
+        buckets = {k: [] for k in CLAVES}
+        faq = {k: [] for k in CLAVES}
+        h = hashlib.sha256()
+
+        for i, archivo in enumerate(self.archivos):
+            if not os.path.exists(archivo):
+                h.update(b"\0")
+                continue
+            with open(archivo, "rb") as f:
+                crudo = f.read()
+            try:
+                data = json.loads(crudo.decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                if anterior is not None:
+                    # Archivo a medio escribir: se conserva el snapshot vigente
+                    return None
+                data = {}
+            h.update(crudo)
+            h.update(b"\0")
+
+            if isinstance(data, dict):
+                for clave in CLAVES:
+                    if clave in data and isinstance(data[clave], list):
+                        buckets[clave].extend(data[clave])
+                        # /foro/faq sólo lista las preguntas del archivo base
+                        if i == 0:
+                            faq[clave] = [p.get("pregunta", "") for p in data[clave]]
+
+        return SnapshotCatalogo(h.hexdigest(), buckets, faq, firmas, self.compilar)
+
+    def snapshot(self) -> SnapshotCatalogo:
+        """Snapshot vigente; revisa los archivos como mucho una vez por `intervalo`"""
+        actual = self._snapshot
+        ahora = time.monotonic()
+        if actual is not None and ahora - self._ultimo_chequeo < self.intervalo:
+            return actual
+
+        firmas = self._firmas()
+        self._ultimo_chequeo = ahora
+        if actual is not None and firmas == actual.firmas:
+            return actual
+
+        with self._lock:
+            actual = self._snapshot
+            if actual is not None and firmas == actual.firmas:
+                return actual
+            try:
+                nuevo = self._cargar(firmas, actual)
+            except Exception as e:
+                print(f"⚠️ No se pudo recargar el catálogo: {e}")
+                nuevo = None
+            if nuevo is None:
+                if actual is None:
+                    nuevo = SnapshotCatalogo("", {}, {k: [] for k in CLAVES}, ())
+                else:
+                    return actual
+            elif actual is not None:
+                print(f"🔄 Catálogo recargado (versión {nuevo.version[:12]})")
+            self._snapshot = nuevo
+            return nuevo
@@ -0,0 +1,279 @@
+"""
+Coalescencia de requests idénticas en curso ("singleflight").
+
+Si llegan varias requests iguales mientras la primera todavía calcula (por
+ejemplo, toda una clase abriendo el mismo reporte), sólo la primera ejecuta
+la consulta y el análisis IA; las demás esperan y reciben el mismo resultado.
+
+Las respuestas en streaming usan `transmitir`: un hilo produce las piezas una
+sola vez y cada request igual las sigue desde el principio a medida que
+llegan (quien llega tarde recibe de golpe lo ya producido y después en vivo).
+
+Dentro de un worker se coordina con un Event por clave. Con `directorio`
+también entre workers: el líder toma un flock sobre `<digest>.lock` y deja el
+resultado en `<digest>.json`; quien esperaba ese lock lo reutiliza si se
+escribió mientras esperaba, en lugar de repetir el cálculo.
+
+El resultado puede traer datos personales (análisis IA, correos), así que el
+archivo se crea con permisos 0600 en un directorio 0700 y el líder lo borra a
+los `retencion` segundos, cuando quienes esperaban ya lo leyeron.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # sin flock (Windows): sólo coalescencia dentro del worker
+    fcntl = None
+
+
+class _Vuelo:
+    __slots__ = ("listo", "resultado", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class _Emision:
+    """Piezas de una respuesta en streaming compartida; cada request la sigue desde el principio"""
+    __slots__ = ("piezas", "terminada", "error", "_cambio")
+
+    def __init__(self):
+        self.piezas = []
+        self.terminada = False
+        self.error = None
+        self._cambio = threading.Condition()
+
+    def agregar(self, pieza):
+        with self._cambio:
+            self.piezas.append(pieza)
+            self._cambio.notify_all()
+
+    def cerrar(self, error=None):
+        with self._cambio:
+            self.error = error
+            self.terminada = True
+            self._cambio.notify_all()
+
+    def seguir(self, espera_max):
+        i = 0
+        while True:
+            with self._cambio:
+                if not self._cambio.wait_for(lambda: len(self.piezas) > i or self.terminada, espera_max):
+                    raise TimeoutError("La respuesta compartida no avanzó a tiempo")
+                nuevas, terminada, error = self.piezas[i:], self.terminada, self.error
+            i += len(nuevas)
+            yield from nuevas
+            if terminada:
+                if error is not None:
+                    raise error
+                return
+
+
+class Coalescedor:
+    def __init__(self, directorio=None, espera_max=60.0, retencion=2.0):
+        self.directorio = directorio if fcntl is not None else None
+        self.espera_max = espera_max
+        self.retencion = retencion
+        self._vuelos = {}
+        self._emisiones = {}
+        self._lock = threading.Lock()
+        self._ultima_poda = 0.0
+        self.lideres = 0
+        self.coalescidas = 0
+        self.entre_workers = 0
+        self.vencidas = 0
+
+    def ejecutar(self, clave, calcular):
+        """Devuelve calcular(), compartiendo el resultado con las llamadas iguales en curso"""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.lideres += 1
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            if not vuelo.listo.wait(self.espera_max):
+                # El líder está trabado: se calcula por separado
+                self.vencidas += 1
+                return calcular()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = self._entre_workers(clave, calcular) if self.directorio else calcular()
+            return vuelo.resultado
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.listo.set()
+
+    def transmitir(self, clave, generar):
+        """
+        Iterador con las piezas de generar(), compartido con las llamadas iguales en
+        curso. Lo produce un hilo aparte: si el cliente que lo inició se desconecta,
+        los demás siguen recibiendo. Con `directorio`, las piezas deben ser JSON.
+        """
+        with self._lock:
+            emision = self._emisiones.get(clave)
+            lider = emision is None
+            if lider:
+                emision = self._emisiones[clave] = _Emision()
+                self.lideres += 1
+            else:
+                self.coalescidas += 1
+        if lider:
+            threading.Thread(
+                target=self._emitir, args=(clave, emision, generar), name="coalescencia", daemon=True
+            ).start()
+        # Entre workers el líder puede esperar espera_max el flock y recién después producir
+        return emision.seguir(self.espera_max * 2)
+
+    def _emitir(self, clave, emision, generar):
+        def producir():
+            for pieza in generar():
+                emision.agregar(pieza)
+            return emision.piezas
+
+        try:
+            if self.directorio:
+                piezas = self._entre_workers(("transmitir", clave), producir)
+                if piezas is not emision.piezas:
+                    # Producidas por otro worker: se reenvían de una vez
+                    for pieza in piezas:
+                        emision.agregar(pieza)
+            else:
+                producir()
+            emision.cerrar()
+        except Exception as e:
+            emision.cerrar(e)
+        finally:
+            with self._lock:
+                self._emisiones.pop(clave, None)
+
+    # --- Entre workers ---
+    def _entre_workers(self, clave, calcular):
+        digest = hashlib.sha256(repr(clave).encode("utf-8")).hexdigest()
+        base = os.path.join(self.directorio, digest)
+        try:
+            os.makedirs(self.directorio, mode=0o700, exist_ok=True)
+            candado = open(f"{base}.lock", "a")
+        except OSError:
+            return calcular()
+
+        with candado:
+            inicio = time.time()
+            limite = time.monotonic() + self.espera_max
+            esperado = False
+            while True:
+                try:
+                    fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= limite:
+                        self.vencidas += 1
+                        return calcular()
+                    esperado = True
+                    time.sleep(0.02)
+            try:
+                os.utime(f"{base}.lock")   # en uso: la poda no lo borra
+                if esperado:
+                    compartido = self._leer(f"{base}.json", inicio)
+                    if compartido is not None:
+                        self.entre_workers += 1
+                        return compartido
+                resultado = calcular()
+                escrito = self._escribir(f"{base}.json", resultado)
+                if escrito is not None:
+                    borrado = threading.Timer(self.retencion, self._borrar, (f"{base}.json", escrito))
+                    borrado.daemon = True
+                    borrado.start()
+                return resultado
+            finally:
+                fcntl.flock(candado, fcntl.LOCK_UN)
+                self._podar()
+
+    @staticmethod
+    def _leer(ruta, desde):
+        """Resultado escrito por otro worker después de `desde`, o None"""
+        try:
+            if os.path.getmtime(ruta) < desde:
+                return None
+            with open(ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _escribir(ruta, resultado):
+        """Deja el resultado para los otros workers (sólo legible por el dueño); devuelve su inodo"""
+        tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(resultado, f, ensure_ascii=False, default=str)
+                inodo = os.fstat(f.fileno()).st_ino
+            os.replace(tmp, ruta)
+            return inodo
+        except (OSError, TypeError, ValueError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+
+    @staticmethod
+    def _borrar(ruta, inodo):
+        """Borra el resultado si sigue siendo el que escribió este líder"""
+        try:
+            if os.stat(ruta).st_ino == inodo:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+    def _podar(self):
+        """Borra locks viejos y resultados que quedaron sin borrar (como mucho una vez por minuto)"""
+        ahora = time.time()
+        if ahora - self._ultima_poda < 60:
+            return
+        self._ultima_poda = ahora
+        edades = {".json": self.retencion, ".tmp": self.espera_max, ".lock": max(3600.0, self.espera_max * 10)}
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            edad = edades.get(os.path.splitext(nombre)[1])
+            if edad is None:
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if ahora - os.path.getmtime(ruta) > edad:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+    def estadisticas(self):
+        with self._lock:
+            en_curso = len(self._vuelos) + len(self._emisiones)
+        return {
+            "en_curso": en_curso,
+            "lideres": self.lideres,
+            "coalescidas": self.coalescidas,
+            "entre_workers": self.entre_workers,
+            "vencidas": self.vencidas,
+            "compartido": bool(self.directorio),
+        }
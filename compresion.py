@@ -0,0 +1,62 @@
+"""
+Compresión de respuestas negociada con Accept-Encoding.
+
+Se prefiere brotli (si el paquete está instalado) y si no gzip. Se saltean
+las respuestas chicas, las ya comprimidas y las de streaming (NDJSON), que
+tienen que llegar al navegador fragmento a fragmento.
+"""
+
+import os
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional: sin brotli se usa sólo gzip
+    brotli = None
+
+COMPRESION_MIN_BYTES = int(os.getenv("COMPRESION_MIN_BYTES", "1024"))
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5
+TIPOS_COMPRIMIBLES = ("application/json", "application/javascript", "text/")
+
+
+def _codificacion_aceptada():
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas["br"] > 0:
+        return "br"
+    if aceptadas["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def comprimir_respuesta(response):
+    """Hook after_request: comprime el cuerpo si el cliente lo acepta"""
+    response.vary.add("Accept-Encoding")
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code >= 300
+        or "Content-Encoding" in response.headers
+        or not (response.mimetype or "").startswith(TIPOS_COMPRIMIBLES)
+    ):
+        return response
+
+    codificacion = _codificacion_aceptada()
+    if codificacion is None:
+        return response
+
+    cuerpo = response.get_data()
+    if len(cuerpo) < COMPRESION_MIN_BYTES:
+        return response
+
+    if codificacion == "br":
+        comprimido = brotli.compress(cuerpo, quality=CALIDAD_BROTLI)
+    else:
+        comprimido = gzip.compress(cuerpo, compresslevel=NIVEL_GZIP)
+
+    response.set_data(comprimido)
+    response.headers["Content-Encoding"] = codificacion
+    return response
@@ -1,60 +1,73 @@
 from flask import Blueprint, jsonify, request
-import mysql.connector
-from mysql.connector import pooling
 import os
-import time
 from dotenv import load_dotenv
 import traceback
+from db import DB_PREFIX, get_conn, PoolAgotado, respuesta_agotado
+from cache_compartido import CacheCompartido, CacheNoDisponible
+from indice_cursos import IndiceCursos
 
 # Forzar carga del .env desde su ruta absoluta
 load_dotenv(dotenv_path="/home/asistenteia/.env")
 
 curso_bp = Blueprint("curso", __name__)
 
-DB_PREFIX = os.getenv("DB_PREFIX")
-if not DB_PREFIX:
-    raise ValueError("⚠️ Debes definir DB_PREFIX en el archivo .env")
+ACCESS_KEY = os.getenv("ACCESS_KEY", "2817")  # 🔒 clave de acceso
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME"),
-    "port": int(os.getenv("DB_PORT", 3306)),
-}
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
 
-POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
 
-ACCESS_KEY = os.getenv("ACCESS_KEY", "2817")  # 🔒 clave de acceso
+def _cargar_cursos():
+    query = f"SELECT id, fullname FROM {DB_PREFIX}course ORDER BY fullname"
+
+    # Ejecutar consulta de forma segura
+    with get_conn() as conn, conn.cursor() as cursor:
+        cursor.execute(query)
+        return [[row[0], row[1]] for row in cursor.fetchall()]
+
+
+# Lista de cursos compartida por los workers: vencido el TTL se sirve la
+# copia vieja mientras un solo proceso la refresca en segundo plano
+cache_cursos = CacheCompartido(
+    os.path.join(CACHE_DIR, "cursos_ids.json"),
+    _cargar_cursos,
+    ttl=float(os.getenv("CURSOS_TTL", "300")),
+    max_obsoleto=float(os.getenv("CURSOS_MAX_OBSOLETO", "3600")),
+)
+# fullname -> [ids] (Moodle no exige nombres únicos), rearmado cuando cambia el ETag
+_ids_por_nombre = (None, {})
+
 
-# Log para depuración
-print("=== Configuración de curso.py ===")
-for k, v in DB_CONFIG.items():
-    if k != "password":
-        print(f"{k}: {v}")
-print(f"DB_PREFIX: {DB_PREFIX}")
-print(f"POOL_SIZE: {POOL_SIZE}")
-print("==================================")
-
-# Pool de conexiones (con fallback)
-try:
-    cnx_pool = pooling.MySQLConnectionPool(
-        pool_name="curso_pool",
-        pool_size=POOL_SIZE,
-        **DB_CONFIG
-    )
-except Exception as e:
-    print(f"⚠️ No se pudo crear el pool de conexiones: {e}. Se usará conexión directa.")
-    cnx_pool = None
-
-def _get_conn():
-    if cnx_pool:
-        return cnx_pool.get_connection()
-    return mysql.connector.connect(**DB_CONFIG)
-
-# Cache simple en memoria (TTL 300s)
-_cache = {"ts": 0.0, "data": []}
-_TTL = 300.0  # 5 minutos
+def _nombres(cursos):
+    return [nombre for _, nombre in cursos]
+
+
+def ids_curso(fullname):
+    """ids del curso según la lista cacheada, o None si no se pudo resolver"""
+    global _ids_por_nombre
+    try:
+        cursos, etag = cache_cursos.obtener()
+    except Exception as e:
+        print(f"⚠️ No se pudo resolver el id del curso: {e}")
+        return None
+    version, mapa = _ids_por_nombre
+    if version != etag:
+        mapa = {}
+        for id_curso, nombre in cursos:
+            mapa.setdefault(nombre, []).append(id_curso)
+        _ids_por_nombre = (etag, mapa)
+    return mapa.get(fullname)
+
+
+# Índice para /buscar; se actualiza cuando cambia el ETag de la lista
+indice_cursos = IndiceCursos()
+BUSCAR_LIMITE_MAX = 50
+
+def _sin_cursos(e):
+    """503 con Retry-After y array vacío (el JS recorre la respuesta con forEach)"""
+    print(f"⚠️ {e}")
+    respuesta = jsonify([])
+    respuesta.headers["Retry-After"] = "2"
+    return respuesta, 503
 
 # 🔒 Función de chequeo de acceso
 def check_access():
@@ -69,26 +82,48 @@ def listar_cursos():
         return jsonify({"error": "🔒 Acceso denegado"}), 403
 
     try:
-        # Cache hit
-        now = time.time()
-        if _cache["data"] and now - _cache["ts"] <= _TTL:
-            return jsonify(_cache["data"])
-
-        query = f"SELECT fullname FROM {DB_PREFIX}course ORDER BY fullname"
+        cursos, etag = cache_cursos.obtener()
+
+        respuesta = jsonify(_nombres(cursos))  # Siempre array
+        # Débil: la compresión cambia los bytes pero no el contenido
+        respuesta.set_etag(etag, weak=True)
+        respuesta.headers["Cache-Control"] = "private, no-cache"
+        return respuesta.make_conditional(request)
+
+    except CacheNoDisponible as e:
+        return _sin_cursos(e)
+    except PoolAgotado as e:
+        return respuesta_agotado(e)
+    except Exception as e:
+        print("❌ Error en /listar:", e)
+        traceback.print_exc()
+        # Devuelvo array vacío para que el JS no falle con forEach
+        return jsonify([]), 500
 
-        # Ejecutar consulta de forma segura
-        with _get_conn() as conn, conn.cursor() as cursor:
-            cursor.execute(query)
-            cursos = [row[0] for row in cursor.fetchall()]
 
-        # Guardar en cache
-        _cache["data"] = cursos
-        _cache["ts"] = now
+@curso_bp.route("/buscar")
+def buscar_cursos():
+    """Typeahead: cursos cuyo nombre coincide con q (sin distinguir acentos)"""
+    if not check_access():
+        return jsonify({"error": "🔒 Acceso denegado"}), 403
 
-        return jsonify(cursos)  # Siempre array
+    q = request.args.get("q", "").strip()
+    try:
+        limite = max(1, min(int(request.args.get("limite", 20)), BUSCAR_LIMITE_MAX))
+    except ValueError:
+        limite = 20
 
+    try:
+        cursos, etag = cache_cursos.obtener()
+        indice_cursos.actualizar(_nombres(cursos), etag)
+        resultados = indice_cursos.buscar(q, limite) if len(q) >= 2 else []
+        return jsonify([{"curso": nombre, "score": score} for nombre, score in resultados])
+
+    except CacheNoDisponible as e:
+        return _sin_cursos(e)
+    except PoolAgotado as e:
+        return respuesta_agotado(e)
     except Exception as e:
-        print("❌ Error en /listar:", e)
+        print("❌ Error en /buscar:", e)
         traceback.print_exc()
-        # Devuelvo array vacío para que el JS no falle con forEach
         return jsonify([]), 500
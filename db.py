@@ -0,0 +1,304 @@
+"""
+Pool de conexiones MySQL compartido por foro y curso.
+
+- Tamaño acotado (DB_POOL_SIZE): nunca hay más conexiones abiertas que eso,
+  tampoco cuando la base está caída (sin tormentas de connect por request).
+- Espera acotada (DB_POOL_TIMEOUT): si no se libera una conexión a tiempo se
+  lanza PoolAgotado, que las rutas devuelven como 503.
+- Chequeo de salud: las conexiones ociosas más de DB_PING_INTERVALO segundos
+  se verifican con ping (y reconectan) antes de entregarse.
+- Sin base (connect fallido) se responde PoolAgotado durante DB_REINTENTO
+  segundos en lugar de reintentar el connect en cada request.
+- Métricas: espera de checkout, conexiones en uso/abiertas, agotamientos.
+- Sentencias preparadas en el servidor (DB_PREPARADAS): cada conexión guarda
+  hasta DB_PREPARADAS_MAX cursores preparados, uno por SQL, y los reutiliza.
+
+Uso:
+    with get_conn() as conn, consulta(conn, sql, params) as cursor:
+        ...
+"""
+
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+import mysql.connector
+from flask import jsonify
+from dotenv import load_dotenv
+
+from recursos import Perezoso
+
+load_dotenv(dotenv_path="/home/asistenteia/.env")
+
+DB_PREFIX = os.getenv("DB_PREFIX")
+if not DB_PREFIX:
+    raise ValueError("⚠️ Debes definir DB_PREFIX en el archivo .env")
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+    "port": int(os.getenv("DB_PORT", 3306)),
+    # El driver C bloquea el loop de gevent; en modo asíncrono se usa el driver puro
+    "use_pure": os.getenv("ASYNC_MODE", "").lower() == "gevent",
+    # Sólo lecturas: sin transacción abierta entre préstamos (evita snapshots viejos)
+    "autocommit": True,
+    "connection_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+}
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+PING_INTERVALO = float(os.getenv("DB_PING_INTERVALO", "30"))
+# Tras un connect fallido no se reintenta durante este lapso (la base está caída)
+REINTENTO_CONEXION = float(os.getenv("DB_REINTENTO", "2"))
+PREPARADAS = os.getenv("DB_PREPARADAS", "1") == "1"
+PREPARADAS_MAX = int(os.getenv("DB_PREPARADAS_MAX", "64"))
+
+# Log para depuración
+print("=== Configuración de la base ===")
+for k, v in DB_CONFIG.items():
+    if k != "password":
+        print(f"{k}: {v}")
+print(f"DB_PREFIX: {DB_PREFIX}")
+print(f"POOL_SIZE: {POOL_SIZE} (espera máx. {POOL_TIMEOUT}s)")
+print("================================")
+
+
+class PoolAgotado(Exception):
+    """No se consiguió conexión dentro de DB_POOL_TIMEOUT"""
+
+
+class PoolMySQL:
+    def __init__(self, config, tamano=5, timeout=5.0, ping_intervalo=30.0, reintento=2.0):
+        self.config = dict(config)
+        self.tamano = tamano
+        self.timeout = timeout
+        self.ping_intervalo = ping_intervalo
+        self.reintento = reintento
+        self._sin_base_hasta = 0.0
+        self._cupos = threading.BoundedSemaphore(tamano)
+        self._libres = deque()   # (conexión, último uso)
+        self._lock = threading.Lock()
+        # Métricas
+        self.abiertas = 0
+        self.en_uso = 0
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.agotamientos = 0
+        self.reconexiones = 0
+        self.descartadas = 0
+        self.errores_conexion = 0
+
+    # --- Préstamo ---
+    def _conectar(self):
+        if time.monotonic() < self._sin_base_hasta:
+            raise PoolAgotado("Base de datos no disponible (reintento en curso)")
+        try:
+            conn = mysql.connector.connect(**self.config)
+        except Exception:
+            with self._lock:
+                self.errores_conexion += 1
+                self._sin_base_hasta = time.monotonic() + self.reintento
+            raise
+        with self._lock:
+            self.abiertas += 1
+        return conn
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.abiertas -= 1
+            self.descartadas += 1
+
+    def _saludable(self, conn, ultimo_uso):
+        if time.monotonic() - ultimo_uso < self.ping_intervalo:
+            return conn
+        try:
+            antes = getattr(conn, "connection_id", None)
+            conn.ping(reconnect=True, attempts=1, delay=0)
+            if getattr(conn, "connection_id", None) != antes:
+                # Reconectó: las sentencias preparadas del servidor ya no existen
+                _olvidar_sentencias(conn)
+            return conn
+        except Exception:
+            # Socket muerto (wait_timeout del servidor, reinicio): se reemplaza
+            self._cerrar(conn)
+            with self._lock:
+                self.reconexiones += 1
+            return self._conectar()
+
+    def tomar(self):
+        t0 = time.monotonic()
+        if not self._cupos.acquire(timeout=self.timeout):
+            with self._lock:
+                self.agotamientos += 1
+            raise PoolAgotado(
+                f"Sin conexiones libres a la base tras {self.timeout:.0f}s ({self.tamano} en uso)"
+            )
+        espera = time.monotonic() - t0
+        try:
+            with self._lock:
+                libre = self._libres.pop() if self._libres else None
+            conn = self._saludable(*libre) if libre else self._conectar()
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self.en_uso += 1
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        with self._lock:
+            self.en_uso -= 1
+        try:
+            # Sin ping al devolver (is_connected hace un round trip): la salud se
+            # verifica al prestar; acá sólo se descarta lo que se sabe roto
+            if descartar or getattr(conn, "unread_result", False):
+                self._cerrar(conn)
+            else:
+                with self._lock:
+                    self._libres.append((conn, time.monotonic()))
+        finally:
+            self._cupos.release()
+
+    def conexion(self):
+        return _Prestamo(self)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "tamano": self.tamano,
+                "abiertas": self.abiertas,
+                "en_uso": self.en_uso,
+                "libres": len(self._libres),
+                "checkouts": self.checkouts,
+                "espera_media_ms": round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "espera_maxima_ms": round(self.espera_maxima * 1000, 3),
+                "agotamientos": self.agotamientos,
+                "reconexiones": self.reconexiones,
+                "descartadas": self.descartadas,
+                "errores_conexion": self.errores_conexion,
+                "timeout_s": self.timeout,
+            }
+
+
+class _Prestamo:
+    """Context manager: entrega la conexión y la devuelve al pool al salir"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = self._pool.tomar()
+        return self._conn
+
+    def __exit__(self, tipo, valor, tb):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            # Ante un error de la base la conexión puede quedar a mitad de un
+            # resultado: se descarta en lugar de reutilizarla
+            self._pool.devolver(conn, descartar=isinstance(valor, mysql.connector.Error))
+        return False
+
+
+# === Sentencias preparadas ===
+def _olvidar_sentencias(conn):
+    """Tras una reconexión: los cursores apuntan a sentencias que el servidor ya liberó"""
+    try:
+        conn._sentencias_preparadas = OrderedDict()
+    except AttributeError:
+        pass
+
+
+def _cerrar_cursor(cursor):
+    """Cierra el cursor y libera su sentencia preparada en el servidor"""
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+@contextmanager
+def consulta(conn, sql, params=None):
+    """
+    Ejecuta `sql` y entrega el cursor (filas como dict, sin bufferizar).
+
+    Con DB_PREPARADAS la sentencia se prepara en el servidor una vez por
+    conexión: el cursor queda guardado en la conexión (LRU) y el driver no la
+    vuelve a preparar si recibe el mismo objeto str (plantilla_sql se ocupa
+    de eso). El cursor no se cierra al salir.
+    """
+    if not PREPARADAS:
+        with conn.cursor(dictionary=True, buffered=False) as cursor:
+            cursor.execute(sql, params or None)
+            yield cursor
+        return
+
+    sentencias = getattr(conn, "_sentencias_preparadas", None)
+    if sentencias is None:
+        sentencias = OrderedDict()
+        try:
+            conn._sentencias_preparadas = sentencias
+        except AttributeError:
+            sentencias = None
+
+    if sentencias is None:
+        # Conexión sin atributos propios: sentencia de un solo uso
+        cursor = conn.cursor(prepared=True, dictionary=True)
+        try:
+            cursor.execute(sql, tuple(params or ()))
+            yield cursor
+        finally:
+            _cerrar_cursor(cursor)
+        return
+
+    guardado = sentencias.pop(sql, None)
+    if guardado is None:
+        while len(sentencias) >= PREPARADAS_MAX:
+            _, (viejo, _) = sentencias.popitem(last=False)
+            _cerrar_cursor(viejo)
+        guardado = (conn.cursor(prepared=True, dictionary=True), sql)
+    cursor, sql_preparada = guardado
+    try:
+        cursor.execute(sql_preparada, tuple(params or ()))
+        sentencias[sql] = guardado
+        yield cursor
+    except Exception:
+        sentencias.pop(sql, None)
+        _cerrar_cursor(cursor)
+        raise
+
+
+# Un pool por worker, creado en el primer uso (se descarta tras un fork)
+pool = Perezoso(
+    "pool MySQL",
+    lambda: PoolMySQL(DB_CONFIG, POOL_SIZE, POOL_TIMEOUT, PING_INTERVALO, REINTENTO_CONEXION),
+    por_proceso=True,
+)
+
+
+def get_conn():
+    return pool.obtener().conexion()
+
+
+def estadisticas():
+    return pool.obtener().estadisticas() if pool.cargado else {"tamano": POOL_SIZE, "abiertas": 0}
+
+
+def respuesta_agotado(e):
+    """503 con Retry-After para PoolAgotado"""
+    print(f"⚠️ {e}")
+    respuesta = jsonify({"status": "error", "message": "⏳ La base está ocupada, reintentá en unos segundos."})
+    respuesta.headers["Retry-After"] = "2"
+    return respuesta, 503
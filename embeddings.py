@@ -0,0 +1,55 @@
+"""
+Backends de inferencia del modelo de embeddings.
+
+- torch: SentenceTransformer estándar (PyTorch).
+- onnx:  ONNX Runtime sobre un export del mismo modelo; por defecto la
+         variante cuantizada int8 que publica el repo del modelo en Hugging
+         Face (onnx/model_qint8_avx2.onnx). Requiere
+         `pip install "sentence-transformers[onnx]"`.
+
+El identificador del backend forma parte de la versión del índice de
+embeddings, así nunca se mezclan vectores de backends distintos.
+"""
+
+import importlib.util
+
+BACKENDS = ("torch", "onnx")
+ARCHIVO_ONNX_DEFECTO = "onnx/model_qint8_avx2.onnx"
+
+
+def resolver_backend(pedido, archivo_onnx=None):
+    """
+    Devuelve (backend, archivo) a usar. Si falta ONNX Runtime se vuelve a
+    torch acá, sin importar nada pesado, para que el índice quede rotulado
+    con el backend que realmente codifica.
+    """
+    backend = (pedido or "torch").strip().lower()
+    if backend not in BACKENDS:
+        print(f"⚠️ EMBED_BACKEND desconocido '{pedido}', se usa torch")
+        return "torch", None
+    if backend == "onnx":
+        faltantes = [m for m in ("onnxruntime", "optimum") if importlib.util.find_spec(m) is None]
+        if faltantes:
+            print(f"⚠️ Backend onnx sin {', '.join(faltantes)}; se usa torch")
+            return "torch", None
+        return "onnx", archivo_onnx or ARCHIVO_ONNX_DEFECTO
+    return "torch", None
+
+
+def identificador(nombre_modelo, backend, archivo=None):
+    """Nombre del modelo + backend (sin ':' porque el índice lo usa como separador)"""
+    if backend == "torch":
+        return nombre_modelo
+    variante = (archivo or "").rsplit("/", 1)[-1].removesuffix(".onnx")
+    return f"{nombre_modelo}@{backend}-{variante}" if variante else f"{nombre_modelo}@{backend}"
+
+
+def cargar_modelo(nombre_modelo, backend="torch", archivo=None):
+    # Importar sentence_transformers trae torch/onnxruntime: sólo al cargar
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        return SentenceTransformer(
+            nombre_modelo, backend="onnx", model_kwargs={"file_name": archivo or ARCHIVO_ONNX_DEFECTO}
+        )
+    return SentenceTransformer(nombre_modelo)
@@ -1,21 +1,39 @@
 import os
 import json
 import re
-import uuid
-import unicodedata
-import mysql.connector
-from mysql.connector import pooling
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, Response, request, jsonify, render_template, stream_with_context
 from dotenv import load_dotenv
-from datetime import datetime
-from decimal import Decimal
 from openai import OpenAI
 from rapidfuzz import fuzz, process
 from cachetools import TTLCache
-from sentence_transformers import SentenceTransformer, util
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+import math
+import hashlib
 import pathlib
+import random
+import threading
+import time
 import traceback
+from indice_semantico import IndiceSemantico
+from catalogo import Catalogo
+from cache_resultados import CacheResultados
+from cache_ia import CacheIA, digest_analisis
+from planificador import planificar_chunks, contar_tokens
+from serializacion import serializar_resultado, serializar_columnas, tipos_columnas
+from recursos import Perezoso, medir, informe_arranque
+from db import DB_PREFIX, get_conn, consulta, PoolAgotado, respuesta_agotado
+from plantilla_sql import PlantillaSQL, con_tiempo_maximo
+from curso import ids_curso
+from trazas import tramo, registrar_etapa, trazas_actuales, debug_pedido
+from auditoria import RegistroAuditoria
+from coalescencia import Coalescedor
+import db
+from embeddings import resolver_backend, identificador, cargar_modelo
+from servidor_embeddings import ClienteEmbeddings, ruta_socket_defecto
+from anonimizador import (
+    anonimizar_hilos, unir_hilos, detectar_fuga, desanonimizar, DesanonimizadorIncremental
+)
 
 # Forzar carga del .env
 load_dotenv(dotenv_path="/home/asistenteia/.env")
@@ -30,8 +48,33 @@ def check_access():
         return False
     return True
 
-# Cargar modelo global al inicio (una sola vez)
-modelo_embed = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+# Modelo de embeddings: se carga en el primer uso (o en el master con preload_app).
+# EMBED_BACKEND=onnx usa ONNX Runtime con el export int8 (EMBED_ONNX_ARCHIVO)
+MODELO_EMBED_NOMBRE = "paraphrase-multilingual-MiniLM-L12-v2"
+EMBED_BACKEND, EMBED_ONNX_ARCHIVO = resolver_backend(
+    os.getenv("EMBED_BACKEND", "torch"), os.getenv("EMBED_ONNX_ARCHIVO")
+)
+
+modelo_embed = Perezoso(
+    f"modelo de embeddings ({EMBED_BACKEND})",
+    lambda: cargar_modelo(MODELO_EMBED_NOMBRE, EMBED_BACKEND, EMBED_ONNX_ARCHIVO),
+)
+
+# Índice de embeddings del catálogo (persistido en disco, abierto con mmap)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+
+def _codificar(textos):
+    return modelo_embed.obtener().encode(textos, convert_to_numpy=True, normalize_embeddings=True)
+
+indice_semantico = IndiceSemantico(
+    _codificar, os.path.join(CACHE_DIR, "embeddings"),
+    identificador(MODELO_EMBED_NOMBRE, EMBED_BACKEND, EMBED_ONNX_ARCHIVO)
+)
+
+# Sidecar de embeddings (EMBED_SIDECAR=1): un solo modelo para todos los workers.
+# Si no responde, se usa el índice y el modelo locales de arriba
+EMBED_SIDECAR = os.getenv("EMBED_SIDECAR", "").lower() in ("1", "true", "si", "sí")
+cliente_embeddings = ClienteEmbeddings(ruta_socket_defecto()) if EMBED_SIDECAR else None
 
 # --- Marco ético ---
 @lru_cache(maxsize=1)
@@ -51,120 +94,245 @@ def _cargar_marco_etico(max_chars: int = 1800) -> str:
             "Respuestas como sugerencia y con revisión humana.")
 
 foro_bp = Blueprint("foro", __name__)
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-DB_PREFIX = os.getenv("DB_PREFIX")
-if not DB_PREFIX:
-    raise ValueError("⚠️ Debes definir DB_PREFIX en el archivo .env")
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "database": os.getenv("DB_NAME"),
-    "port": int(os.getenv("DB_PORT", 3306))
-}
-
-# Pool de conexiones
-POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
-try:
-    cnx_pool = pooling.MySQLConnectionPool(
-        pool_name="foro_pool",
-        pool_size=POOL_SIZE,
-        **DB_CONFIG
-    )
-except Exception:
-    cnx_pool = None
-
-def get_conn():
-    if cnx_pool:
-        return cnx_pool.get_connection()
-    return mysql.connector.connect(**DB_CONFIG)
+openai_client = Perezoso(
+    "cliente OpenAI", lambda: OpenAI(api_key=os.getenv("OPENAI_API_KEY")), por_proceso=True
+)
 
 SQL_JSON_PATH = os.path.join(os.path.dirname(__file__), "sql_base.json")
+ARCHIVOS_CATALOGO = [
+    SQL_JSON_PATH,
+    os.path.join(os.path.dirname(__file__), "sql_ejemplos.json"),
+]
+
+def _compilar_entrada(entrada):
+    return PlantillaSQL(entrada["sql"], DB_PREFIX, _keyset_entrada(entrada))
+
+# Catálogo parseado (y su SQL precompilada) una vez por worker; se recarga solo si cambian los archivos
+catalogo = Catalogo(
+    ARCHIVOS_CATALOGO,
+    intervalo=float(os.getenv("CATALOGO_INTERVALO", "2")),
+    compilar=_compilar_entrada,
+)
 LOG_PATH = os.path.join(os.path.dirname(__file__), "interacciones.log")
-
-MODULO_TRAD = {"forum": "Foro", "assign": "Tarea", "resource": "Archivo", "quiz": "Cuestionario"}
-TRADUCCION_COLUMNAS = {
-    "firstname": "Nombre", "lastname": "Apellido", "message": "Mensaje",
-    "fecha": "Fecha", "finalgrade": "Nota", "promedio": "Promedio",
-    "fullname": "Curso", "ultima_conexion": "Última conexión",
-    "primera_conexion": "Primera conexión", "accesos": "Cantidad de accesos",
-    "tipo_recurso": "Tipo de recurso", "cantidad": "Cantidad",
-    "duedate": "Fecha de Finalización"
-}
+# Auditoría en segundo plano (JSON lines, lotes con fsync, rotación con gzip)
+registro_auditoria = RegistroAuditoria(
+    LOG_PATH,
+    max_cola=int(os.getenv("AUDITORIA_COLA", "10000")),
+    intervalo_fsync=float(os.getenv("AUDITORIA_FSYNC", "1")),
+    max_bytes=int(os.getenv("AUDITORIA_MAX_MB", "50")) * 1024 * 1024,
+    max_horas=float(os.getenv("AUDITORIA_ROTAR_HORAS", "24")),
+    conservar=int(os.getenv("AUDITORIA_CONSERVAR", "10")),
+)
+# Coalescencia de /procesar: dentro del worker siempre; entre workers con COALESCER_WORKERS=1
+coalescedor = Coalescedor(
+    os.path.join(CACHE_DIR, "vuelos") if os.getenv("COALESCER_WORKERS", "0") == "1" else None,
+    espera_max=float(os.getenv("COALESCER_ESPERA", "60")),
+    retencion=float(os.getenv("COALESCER_RETENCION", "2")),
+)
+# Auditoría de prompts enviados a OpenAI (nunca a stdout):
+#   off       nada
+#   hash      sha256, tamaños y tokens de cada prompt
+#   muestreo  como hash, con el texto completo en una fracción AUDITORIA_MUESTREO
+#   completo  texto completo de cada prompt
+MODOS_AUDITORIA_PROMPT = ("off", "hash", "muestreo", "completo")
+AUDITORIA_PROMPT = os.getenv("AUDITORIA_PROMPT", "hash").lower()
+if AUDITORIA_PROMPT not in MODOS_AUDITORIA_PROMPT:
+    print(f"⚠️ AUDITORIA_PROMPT={AUDITORIA_PROMPT!r} no es válido; se usa 'hash'")
+    AUDITORIA_PROMPT = "hash"
+AUDITORIA_MUESTREO = float(os.getenv("AUDITORIA_MUESTREO", "0.05"))
+
+# Modelo y parámetros del análisis IA (forman parte de la clave del cache)
+IA_MODELO = os.getenv("IA_MODELO", "gpt-4o-mini")
+IA_TEMPERATURA = 0.3
+
+# Presupuesto por prompt: foros más grandes se analizan por fragmentos (map-reduce)
+IA_TOKENS_CHUNK = int(os.getenv("IA_TOKENS_CHUNK", "12000"))
+IA_CONCURRENCIA = int(os.getenv("IA_CONCURRENCIA", "4"))
 
 ia_cache = TTLCache(maxsize=100, ttl=3600)
+# Análisis memoizados; IA_CACHE_DB (SQLite) los conserva entre reinicios de workers
+analisis_cache = CacheIA(ia_cache, os.getenv("IA_CACHE_DB"))
 
-# === Seguridad SQL ===
-LEER_REGEX = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
-def es_solo_lectura(sql: str) -> bool:
-    if not sql:
-        return False
-    partes = [p.strip() for p in sql.split(';') if p.strip()]
-    return bool(partes) and all(LEER_REGEX.match(sent) for sent in partes)
+# Tipos de columna (cursor.description) por SQL preparada, para el plan de serialización
+_tipos_por_sql = {}
+
+# Formato compacto opcional de las respuestas tabulares ({"columns", "rows"})
+FORMATO_COLUMNAS = "columnas"
+
+# Filas por lote en las respuestas en streaming
+FILAS_POR_LOTE = int(os.getenv("FILAS_POR_LOTE", "200"))
+# Resultados en streaming de hasta estas filas también se guardan en el cache de resultados
+STREAM_CACHE_FILAS = int(os.getenv("SQL_CACHE_FILAS_STREAM", "5000"))
+
+# Cache de resultados SQL (LRU por bytes; TTL por entrada del catálogo con la clave "ttl")
+cache_resultados = CacheResultados(
+    max_bytes=int(os.getenv("SQL_CACHE_MB", "64")) * 1024 * 1024,
+    ttl_defecto=float(os.getenv("SQL_CACHE_TTL", "60")),
+)
 
 # === Logs ===
 def log_to_file(pregunta, respuesta, curso):
-    try:
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(f"[{datetime.now().isoformat()}] Curso: {curso}\n")
-            f.write(f"Pregunta: {pregunta}\n")
-            f.write(f"Respuesta: {respuesta}\n")
-            f.write("=" * 80 + "\n")
-    except Exception as e:
-        pass
-
-# === Serialización de resultados ===
-def serializar_resultado(data):
-    resultado = []
-    for fila in data:
-        nueva = {}
-        for k, v in fila.items():
-            key = "cantidad" if isinstance(k, str) and "count" in k.lower() else k
-            if isinstance(v, Decimal):
-                v = float(v)
-            if isinstance(v, (int, float)) and isinstance(key, str) and any(
-                t in key.lower() for t in ["fecha", "time", "conexion", "due", "duedate", "created"]
-            ):
+    """Encola el registro; la escritura a disco la hace el hilo de auditoría"""
+    registro_auditoria.registrar("interaccion", curso=curso, pregunta=pregunta, respuesta=respuesta)
+
+def _serializar(resultados, sql_prepared, formato):
+    """Formato "columnas" ({columns, rows}) a pedido del cliente; por defecto lista de filas"""
+    tipos = _tipos_por_sql.get(sql_prepared)
+    with tramo("serializacion"):
+        if formato == FORMATO_COLUMNAS:
+            return serializar_columnas(resultados, tipos)
+        return serializar_resultado(resultados, tipos)
+
+# === Preparar SQL ===
+@lru_cache(maxsize=256)
+def _plantilla_cliente(sql_raw):
+    return PlantillaSQL(sql_raw, DB_PREFIX)
+
+def _plantilla(sql_raw, snapshot):
+    """Plantilla precompilada del catálogo; SQL fuera del catálogo se compila aparte (LRU)"""
+    plantilla = snapshot.plantilla_por_sql(sql_raw)
+    return plantilla if plantilla is not None else _plantilla_cliente(sql_raw)
+
+def _keyset_entrada(entrada):
+    keyset = (entrada or {}).get("keyset")
+    if isinstance(keyset, dict) and keyset.get("columna") and keyset.get("campo"):
+        return keyset
+    return None
+
+def _siguiente_cursor(ultima_fila, keyset, has_more):
+    """Valor de la columna de orden en la última fila: el cliente lo manda como `cursor`"""
+    if not keyset or not has_more or not ultima_fila:
+        return None
+    return ultima_fila.get(keyset["campo"])
+
+# === Ejecutar SQL (con cache de resultados) ===
+def _ttl_entrada(entrada):
+    if entrada and entrada.get("ttl") is not None:
+        try:
+            return float(entrada["ttl"])
+        except (TypeError, ValueError):
+            pass
+    return None
+
+def _registrar_tipos(sql_prepared, description):
+    """Tipos de columna por SQL: el plan de serialización los usa también en hits de cache"""
+    tipos = tipos_columnas(description)
+    if tipos is None:
+        return
+    if len(_tipos_por_sql) >= 1024:
+        _tipos_por_sql.clear()
+    _tipos_por_sql[sql_prepared] = tipos
+
+def _ejecutar_consulta(sql_prepared, params, curso, page, size, ttl=None, tiempo_max_ms=None):
+    clave = cache_resultados.clave(sql_prepared, params, page, size)
+    resultados = cache_resultados.obtener(clave)
+    if resultados is not None:
+        return resultados
+
+    # El hint de tiempo sólo cambia la SQL ejecutada; cache y tipos usan la original
+    sql_ejecutada = con_tiempo_maximo(sql_prepared, tiempo_max_ms) if tiempo_max_ms else sql_prepared
+    with tramo("sql"), get_conn() as conn, consulta(conn, sql_ejecutada, params) as cursor:
+        resultados = cursor.fetchall()
+        _registrar_tipos(sql_prepared, cursor.description)
+
+    cache_resultados.guardar(clave, resultados, ttl, curso)
+    return resultados
+
+def _iterar_lotes(sql_prepared, params, page, size, ttl=None, curso=""):
+    """
+    Filas en lotes con cursor no bufferizado. Mientras se transmiten se juntan
+    (hasta STREAM_CACHE_FILAS) y, si el cursor se leyó entero, van al cache de resultados.
+    """
+    clave = cache_resultados.clave(sql_prepared, params, page, size)
+    cacheadas = cache_resultados.obtener(clave)
+    if cacheadas is not None:
+        for i in range(0, len(cacheadas), FILAS_POR_LOTE):
+            yield cacheadas[i:i + FILAS_POR_LOTE]
+        return
+
+    # Sólo cuenta el tiempo en la base, no el que tarda el cliente en leer
+    t0 = time.perf_counter()
+    en_base = 0.0
+    leidas = []
+    with get_conn() as conn, consulta(conn, sql_prepared, params) as cursor:
+        _registrar_tipos(sql_prepared, cursor.description)
+        agotado = False
+        try:
+            while True:
+                lote = cursor.fetchmany(FILAS_POR_LOTE)
+                en_base += time.perf_counter() - t0
+                if not lote:
+                    agotado = True
+                    break
+                if leidas is not None:
+                    leidas.extend(lote)
+                    if len(leidas) > STREAM_CACHE_FILAS:
+                        leidas = None   # demasiado grande para el cache: sólo se transmite
+                yield lote
+                t0 = time.perf_counter()
+        finally:
+            registrar_etapa("sql", en_base)
+            if not agotado:
+                # Cliente desconectado: hay que leer el resto antes de devolver la conexión
                 try:
-                    v = datetime.fromtimestamp(v).strftime("%d/%m/%Y %H:%M")
+                    cursor.fetchall()
                 except Exception:
                     pass
-            elif isinstance(v, datetime):
-                v = v.strftime("%d/%m/%Y %H:%M")
-            key_esp = TRADUCCION_COLUMNAS.get(key, key)
-            if key_esp == "Tipo de recurso":
-                v = MODULO_TRAD.get(str(v).lower(), v)
-            nueva[key_esp] = v
-        resultado.append(nueva)
-    return resultado
 
-# === Preparar SQL ===
-def _prepare_sql_and_params(sql_raw: str, curso: str, page: int, size: int):
-    if not sql_raw:
-        return "", [], False
-    sql = sql_raw.replace("{PREFIX}", DB_PREFIX).strip()
-    params = []
-    sql, n1 = re.subn(r"(['\"])__CURSO__\1", "%s", sql)
-    sql, n2 = re.subn(r"\b__CURSO__\b", "%s", sql)
-    apariciones = n1 + n2
-    if apariciones > 0 and curso:
-        params.extend([curso] * apariciones)
-
-    def _map_course_eq_placeholder(m):
-        left = m.group(1)
-        return f"{left}(SELECT id FROM {DB_PREFIX}course WHERE fullname = %s LIMIT 1)"
-
-    if curso and "%s" in sql:
-        sql = re.sub(r"(\b(?:\w+\.)?course\s*=\s*)%s\b",
-                     _map_course_eq_placeholder, sql, flags=re.IGNORECASE)
-
-    has_limit = bool(re.search(r"\blimit\s+\d+", sql, flags=re.IGNORECASE))
-    if not has_limit:
-        sql = sql.rstrip(";") + " LIMIT %s OFFSET %s"
-        params.extend([size, (page - 1) * size])
-    return sql, params, has_limit
+    # Sólo se llega acá si el cliente leyó todo: el resultado está completo
+    if leidas is not None:
+        cache_resultados.guardar(clave, leidas, ttl, curso)
+
+def _lineas_filas(sql_prepared, params, page, size, had_limit, keyset, formato, ttl, curso):
+    """Líneas NDJSON con los lotes y, al final, el dict del fin (se comparten entre requests iguales)"""
+    total, ultima = 0, None
+    for lote in _iterar_lotes(sql_prepared, params, page, size, ttl, curso):
+        total += len(lote)
+        ultima = lote[-1]
+        if formato == FORMATO_COLUMNAS:
+            evento = {"tipo": "filas", **_serializar(lote, sql_prepared, formato)}
+        else:
+            evento = {"tipo": "filas", "filas": _serializar(lote, sql_prepared, formato)}
+        yield json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+    has_more = (total == size) and (not had_limit)
+    fin = {"tipo": "fin", "count": total, "has_more": has_more}
+    if keyset:
+        fin["next_cursor"] = _siguiente_cursor(ultima, keyset, has_more)
+    yield fin
+
+def _respuesta_filas_stream(meta, sql_prepared, params, page, size, had_limit,
+                            keyset=None, al_terminar=None, formato=None, ttl=None, curso=""):
+    """Respuesta NDJSON: meta, lotes de filas ya serializadas y fin con el conteo"""
+    # Requests iguales en curso siguen la misma lectura en lugar de repetir la consulta
+    piezas = coalescedor.transmitir(
+        ("filas", sql_prepared, tuple(params), page, size, formato),
+        lambda: _lineas_filas(sql_prepared, params, page, size, had_limit, keyset, formato, ttl, curso)
+    )
+
+    def generar():
+        yield json.dumps({"tipo": "meta", **meta}, ensure_ascii=False, default=str) + "\n"
+        fin = None
+        try:
+            for pieza in piezas:
+                if isinstance(pieza, dict):
+                    fin = dict(pieza)
+                else:
+                    yield pieza
+        except Exception as e:
+            print(f"❌ Error en streaming de filas: {e}")
+            yield json.dumps({"tipo": "error", "message": f"Error: {str(e)}"}, ensure_ascii=False) + "\n"
+            return
+        if al_terminar:
+            al_terminar(fin["count"])
+        if debug_pedido():
+            fin["trazas"] = trazas_actuales()
+        yield json.dumps(fin, ensure_ascii=False, default=str) + "\n"
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # === Rutas ===
 @foro_bp.route("/procesar", methods=["POST"])
@@ -179,6 +347,9 @@ def procesar():
         libre = bool(data.get("libre", False))
         guardar = bool(data.get("guardar", False))
         consent_ia = bool(data.get("consentIA", False))   
+        stream = bool(data.get("stream", False))
+        cursor_keyset = data.get("cursor")
+        formato = data.get("formato")
 
         page = int(data.get("page", 1))
         size = int(data.get("size", 200))
@@ -186,28 +357,18 @@ def procesar():
             page = 1
         size = max(1, min(size, 1000))
 
-        preguntas_json = cargar_preguntas()
-
-        if "__CURSO__" in pregunta or curso:
-            todas = preguntas_json.get("por_curso", []) + preguntas_json.get("por_curso_ia", [])
-        else:
-            todas = preguntas_json.get("generales", []) + preguntas_json.get("generales_ia", [])
+        snapshot = catalogo.snapshot()
+        con_curso = "__CURSO__" in pregunta or bool(curso)
 
-        match = None
         ruta = "json_coincidencia"
-        if not libre:
-            match = encontrar_pregunta_similar(pregunta, todas)
+        match, top, _ = recuperar_preguntas(
+            pregunta, snapshot, con_curso, usar_fuzzy=not libre, usar_ia=consent_ia, top_k=5
+        )
 
         if not match:
-            candidatos = buscar_semantico(pregunta, todas, top_k=5)
-
-            if consent_ia:
-                top = rerank_con_ia(pregunta, candidatos)
-            else:
-                top = candidatos
-
             if top:
-                mejor = top[0]
+                # Copia: las entradas pertenecen al snapshot compartido del catálogo
+                mejor = dict(top[0])
                 if not mejor.get("score"):
                     mejor["score"] = fuzz.ratio(pregunta.lower(), mejor["pregunta"].lower())
 
@@ -234,232 +395,297 @@ def procesar():
                     "message": "⚠️ No se encontró una consulta predefinida ni sugerencias semánticas."
                 }), 400
 
-        sql_prepared, params, had_limit = _prepare_sql_and_params(
-            match["sql"], curso, page, size
-        )
-
-        if not es_solo_lectura(sql_prepared):
+        plantilla = _plantilla(match["sql"], snapshot)
+        if not plantilla.solo_lectura:
             return jsonify({
                 "status": "error",
                 "message": "⚠️ Solo se permiten consultas de lectura (SELECT/WITH)."
             }), 400
 
-        with get_conn() as conn, conn.cursor(dictionary=True) as cursor:
-            cursor.execute(sql_prepared, params or None)
-            resultados = cursor.fetchall()
-
-        if match.get("descripcion"):
-            if not consent_ia:
-                return jsonify({
-                    "status": "error",
-                    "message": "⚠️ Esta consulta requiere análisis IA, pero no diste tu consentimiento."
-                }), 403
-
-            descripcion = match["descripcion"]
-            # 🚀 LE PASAMOS LA CONSULTA SQL PARA QUE DETERMINE EL ORDEN CRONOLÓGICO
-            respuesta_ia = procesar_pregunta_ia(descripcion, resultados, sql_prepared)
+        keyset = plantilla.keyset
+        sql_prepared, params, had_limit = plantilla.preparar(
+            curso, page, size, cursor_keyset, ids_curso
+        )
 
-            if guardar:
-                log_to_file(pregunta, str(respuesta_ia), curso)
+        if stream and not match.get("descripcion"):
+            return _respuesta_filas_stream(
+                {
+                    "status": "ok",
+                    "ia": False,
+                    "ruta": ruta,
+                    "explicacion": match.get("explicacion", ""),
+                    "query": sql_prepared,
+                    "params": params,
+                    "page": page,
+                    "size": size,
+                },
+                sql_prepared, params, page, size, had_limit, keyset,
+                (lambda total: log_to_file(pregunta, f"{total} filas (streaming)", curso)) if guardar else None,
+                formato=formato, ttl=_ttl_entrada(match), curso=curso
+            )
 
+        if match.get("descripcion") and not consent_ia:
             return jsonify({
-                "status": "ok",
-                "ia": True,
-                "ruta": ruta,
-                "explicacion": match.get("explicacion", ""),
-                "respuesta": [{"Análisis IA": respuesta_ia}],
-                "query": sql_prepared,
-                "params": params,
-                "page": page,
-                "size": size,
-                "count": len(resultados),
-                "has_more": (len(resultados) == size) and (not had_limit)
-            })
-
-        data_final = serializar_resultado(resultados)
+                "status": "error",
+                "message": "⚠️ Esta consulta requiere análisis IA, pero no diste tu consentimiento."
+            }), 403
+
+        if stream and match.get("descripcion"):
+            resumen, fragmentos = _analisis_ia_compartido(
+                match["descripcion"], sql_prepared, params, curso, page, size, had_limit, _ttl_entrada(match)
+            )
+            return _respuesta_ia_stream(
+                {
+                    "status": "ok",
+                    "ia": True,
+                    "ruta": ruta,
+                    "explicacion": match.get("explicacion", ""),
+                    "query": sql_prepared,
+                    "params": params,
+                    "page": page,
+                    "size": size,
+                    **resumen
+                },
+                fragmentos,
+                (lambda texto: log_to_file(pregunta, texto, curso)) if guardar else None
+            )
+
+        # Requests idénticas en curso esperan el mismo cálculo (SQL + IA) en lugar de repetirlo
+        clave_vuelo = (
+            match.get("pregunta"), ruta, sql_prepared, tuple(params), page, size,
+            consent_ia, formato, cursor_keyset,
+        )
+        respuesta = coalescedor.ejecutar(
+            clave_vuelo,
+            lambda: _calcular_respuesta(match, ruta, sql_prepared, params, curso, page, size,
+                                        had_limit, keyset, formato)
+        )
 
         if guardar:
-            log_to_file(pregunta, str(data_final), curso)
-
-        return jsonify({
-            "status": "ok",
-            "ia": False,
-            "ruta": ruta,
-            "explicacion": match.get("explicacion", ""),
-            "respuesta": data_final,
-            "query": sql_prepared,
-            "params": params,
-            "page": page,
-            "size": size,
-            "count": len(resultados),
-            "has_more": (len(resultados) == size) and (not had_limit)
-        })
+            registrado = respuesta["respuesta"][0]["Análisis IA"] if respuesta["ia"] else respuesta["respuesta"]
+            log_to_file(pregunta, str(registrado), curso)
+        return jsonify(respuesta)
 
+    except PoolAgotado as e:
+        return respuesta_agotado(e)
     except Exception as e:
         print(f"❌ Error procesando: {e}")
         return jsonify({"status": "error", "message": f"Error: {str(e)}"}), 500
 
 
-# === Procesar IA (MOTOR ENTERPRISE CON CRONOLOGÍA DINÁMICA) ===
-def procesar_pregunta_ia(descripcion, mensajes, query_sql=""):
-    if not mensajes:
-        return "⚠️ No se encontraron mensajes para analizar en este curso."
-        
-    hilos = {}
-    mapa_reemplazos = {}  
-    mapa_inverso = {}     
-    autores_procesados = set()
-
-    # ALIASES GLOBALES DE APOYO
-    ALIASES_BASE = {
-        "matias": ["mati"],
-        "matías": ["mati"],
-        "camila": ["cami"],
-        "profesor": ["profe", "prof"],
-        "profesora": ["profe", "prof"]
+def _fragmentos_ia(descripcion, sql_prepared, params, curso, page, size, had_limit, ttl):
+    """Primero {count, has_more} de la consulta y después los fragmentos del análisis IA"""
+    resultados = _ejecutar_consulta(sql_prepared, params, curso, page, size, ttl)
+    yield {"count": len(resultados), "has_more": (len(resultados) == size) and (not had_limit)}
+    yield from procesar_pregunta_ia_stream(descripcion, resultados, sql_prepared)
+
+def _analisis_ia_compartido(descripcion, sql_prepared, params, curso, page, size, had_limit, ttl):
+    """
+    (resumen, fragmentos) del análisis IA en streaming. Las requests iguales en curso
+    comparten la consulta y la llamada a OpenAI; espera a la consulta, así un
+    PoolAgotado llega como 503 antes de empezar a responder.
+    """
+    piezas = coalescedor.transmitir(
+        ("ia", descripcion, sql_prepared, tuple(params), page, size),
+        lambda: _fragmentos_ia(descripcion, sql_prepared, params, curso, page, size, had_limit, ttl)
+    )
+    return next(piezas), piezas
+
+def _calcular_respuesta(match, ruta, sql_prepared, params, curso, page, size, had_limit, keyset, formato):
+    """Consulta + (análisis IA o serialización) de /procesar, sin streaming"""
+    resultados = _ejecutar_consulta(
+        sql_prepared, params, curso, page, size, _ttl_entrada(match)
+    )
+    has_more = (len(resultados) == size) and (not had_limit)
+    respuesta = {
+        "status": "ok",
+        "ia": bool(match.get("descripcion")),
+        "ruta": ruta,
+        "explicacion": match.get("explicacion", ""),
+        "query": sql_prepared,
+        "params": params,
+        "page": page,
+        "size": size,
+        "count": len(resultados),
+        "has_more": has_more
     }
 
-    # 1. ORDEN CRONOLÓGICO DINÁMICO
-    if "DESC" in query_sql.upper():
-        mensajes_cronologicos = list(reversed(mensajes))
-    else:
-        mensajes_cronologicos = list(mensajes)
+    if match.get("descripcion"):
+        # 🚀 LE PASAMOS LA CONSULTA SQL PARA QUE DETERMINE EL ORDEN CRONOLÓGICO
+        with tramo("ia"):
+            respuesta_ia = procesar_pregunta_ia(match["descripcion"], resultados, sql_prepared)
+        respuesta["respuesta"] = [{"Análisis IA": respuesta_ia}]
+        return respuesta
+
+    respuesta["respuesta"] = _serializar(resultados, sql_prepared, formato)
+    if keyset:
+        respuesta["next_cursor"] = _siguiente_cursor(
+            resultados[-1] if resultados else None, keyset, has_more
+        )
+    return respuesta
+
+
+# === Tablero del curso (varias consultas del catálogo en paralelo) ===
+TABLERO_MAX_PREGUNTAS = int(os.getenv("TABLERO_MAX_PREGUNTAS", "12"))
+TABLERO_TIMEOUT = float(os.getenv("TABLERO_TIMEOUT", "10"))
+# Por debajo del pool: un tablero nunca acapara todas las conexiones del worker
+TABLERO_CONCURRENCIA = max(0, min(int(os.getenv("TABLERO_CONCURRENCIA", "3")), db.POOL_SIZE - 1))
+# Compartido por todas las requests del worker: el tope vale también entre tableros simultáneos.
+# Con DB_POOL_SIZE=1 no queda conexión libre para paralelizar: las consultas corren
+# una tras otra en el hilo de la request
+_ejecutor_tablero = (
+    ThreadPoolExecutor(max_workers=TABLERO_CONCURRENCIA, thread_name_prefix="tablero")
+    if TABLERO_CONCURRENCIA > 0 else None
+)
+if _ejecutor_tablero is None:
+    print("ℹ️ Tablero secuencial: DB_POOL_SIZE=1 no deja conexiones para consultas en paralelo")
+ER_QUERY_TIMEOUT = 3024   # MAX_EXECUTION_TIME superado
+
+def _timeout_tablero(pregunta):
+    return {"pregunta": pregunta, "status": "timeout",
+            "message": f"⏳ La consulta superó {TABLERO_TIMEOUT:.0f}s"}
+
+def _consulta_tablero(pregunta, entrada, sql_prepared, params, curso, page, size, had_limit, formato,
+                      tiempo_max=None):
+    try:
+        resultados = _ejecutar_consulta(
+            sql_prepared, params, curso, page, size, _ttl_entrada(entrada),
+            tiempo_max_ms=(tiempo_max or TABLERO_TIMEOUT) * 1000
+        )
+    except PoolAgotado as e:
+        return {"pregunta": pregunta, "status": "error", "message": str(e)}
+    except Exception as e:
+        if getattr(e, "errno", None) == ER_QUERY_TIMEOUT:
+            return _timeout_tablero(pregunta)
+        print(f"❌ Error en tablero ({pregunta}): {e}")
+        return {"pregunta": pregunta, "status": "error", "message": f"Error: {str(e)}"}
+
+    return {
+        "pregunta": pregunta,
+        "status": "ok",
+        "explicacion": entrada.get("explicacion", ""),
+        "respuesta": _serializar(resultados, sql_prepared, formato),
+        "query": sql_prepared,
+        "params": params,
+        "count": len(resultados),
+        "has_more": (len(resultados) == size) and (not had_limit),
+    }
 
-    # Helpers de Normalización
-    def sin_acentos(texto):
-        return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+@foro_bp.route("/tablero", methods=["POST"])
+def tablero():
+    """Varias preguntas del catálogo para un curso en una sola respuesta (resultados parciales si alguna tarda)"""
+    if not check_access():
+        return jsonify({"error": "🔒 Acceso denegado"}), 403
 
-    def generar_variantes(texto):
-        if not texto: return []
-        partes = [texto] + texto.split()
-        variantes = set()
-        
-        # Mapa simple para adivinar posibles tildes faltantes o extras
-        tildes_map = {'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ó', 'u': 'ú'}
-        tildes_inv = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'}
-        
-        for p in partes:
-            p = p.strip()
-            if len(p) > 2:
-                variantes.add(p)
-                variantes.add(sin_acentos(p))
-                variantes.add(p.lower())
-                variantes.add(sin_acentos(p).lower())
-                
-                # Agregar variantes forzando tildes por si faltan
-                p_lower = p.lower()
-                for sin_t, con_t in tildes_map.items():
-                    if sin_t in p_lower:
-                        variantes.add(p_lower.replace(sin_t, con_t))
-                
-                # Agregar variantes sacando tildes por si sobran
-                for con_t, sin_t in tildes_inv.items():
-                    if con_t in p_lower:
-                        variantes.add(p_lower.replace(con_t, sin_t))
-                        
-        return list(variantes)
-        
-    def desanonimizar_respuesta(texto, mapa_inverso_local):
-        resultado = texto
-        for pseudo, real in mapa_inverso_local.items():
-            patron = r'\b' + re.escape(pseudo) + r'\b'
-            resultado = re.sub(patron, real, resultado)
-        return resultado
-        
-    def detectar_fuga(texto, variantes_conocidas):
-        texto_norm = sin_acentos(texto.lower())
-        for variante in variantes_conocidas:
-            if len(variante) > 3 and sin_acentos(variante.lower()) in texto_norm:
-                return variante
-        return None
+    try:
+        data = request.get_json() or {}
+        curso = data.get("curso", "").strip()
+        preguntas = data.get("preguntas") or []
+        formato = data.get("formato")
+        size = max(1, min(int(data.get("size", 200)), 1000))
+        page = 1
+
+        if not curso:
+            return jsonify({"status": "error", "message": "⚠️ Indicá el curso."}), 400
+        if not ids_curso(curso):
+            return jsonify({"status": "error", "message": f"⚠️ No se encontró el curso '{curso}'."}), 400
+        if not isinstance(preguntas, list) or not preguntas:
+            return jsonify({"status": "error", "message": "⚠️ Indicá al menos una pregunta del catálogo."}), 400
+        if len(preguntas) > TABLERO_MAX_PREGUNTAS:
+            return jsonify({
+                "status": "error",
+                "message": f"⚠️ Como máximo {TABLERO_MAX_PREGUNTAS} preguntas por tablero."
+            }), 400
 
-    # 2. GENERAR MAPA DE USUARIOS CON UUID Y VARIANTES DINÁMICAS
-    todas_las_variantes_generadas = set()
-    for m in mensajes_cronologicos:
-        firstname = m.get('firstname', '').strip()
-        lastname = m.get('lastname', '').strip()
-        autor_real = f"{firstname} {lastname}".strip()
-        
-        if autor_real and autor_real not in autores_procesados:
-            pseudonimo = f"Usuario_{str(uuid.uuid4())[:6]}"
-            autores_procesados.add(autor_real)
-            
-            variantes_usuario = generar_variantes(firstname) + generar_variantes(lastname) + generar_variantes(autor_real)
-            
-            fname_lower = sin_acentos(firstname.lower())
-            if fname_lower in ALIASES_BASE:
-                variantes_usuario.extend(ALIASES_BASE[fname_lower])
-            
-            for v in set(variantes_usuario):
-                if v and v not in mapa_reemplazos:
-                    mapa_reemplazos[v] = pseudonimo
-                    todas_las_variantes_generadas.add(v)
-                    
-            mapa_inverso[pseudonimo] = autor_real
-
-    claves_ordenadas = sorted(mapa_reemplazos.keys(), key=len, reverse=True)
-
-    # 3. CONSTRUIR HILOS, LIMPIEZA HTML Y REEMPLAZO ROBUSTO
-    for m in mensajes_cronologicos:
-        if not m.get('message'):
-            continue
-            
-        hilo_id = m.get('discusion_id') or m.get('tema') or 'General'
-        if hilo_id not in hilos:
-            hilos[hilo_id] = []
-        
-        autor_real = f"{m.get('firstname', '')} {m.get('lastname', '')}".strip()
-        
-        pseudonimo = None
-        for variante in generar_variantes(autor_real):
-            if variante in mapa_reemplazos:
-                pseudonimo = mapa_reemplazos[variante]
-                break
-
-        if not pseudonimo:
-            pseudonimo = "Usuario_Desconocido"
-            
-        texto_crudo = m.get('message', '').strip()
-        
-        # PASO 1 — LIMPIAR SÓLO HTML Y ESPACIOS MÚLTIPLES (Preservamos puntuación)
-        texto = re.sub(r'<[^>]+>', ' ', texto_crudo)
-        texto = re.sub(r'\s+', ' ', texto).strip()
-        
-        # PASO 2 — REEMPLAZO DESCENDENTE SEGURO
-        for nombre_real in claves_ordenadas:
-            pseudo = mapa_reemplazos[nombre_real]
-            patron = r'(?i)(?<!\w)' + re.escape(nombre_real) + r'(?!\w)'
-            texto = re.sub(patron, pseudo, texto)
-
-        # ✨ ACÁ INYECTAMOS LOS DATOS FALTANTES PARA LA IA
-        fecha_msg = m.get('fecha', '')
-        curso_msg = m.get('curso', '')
-        foro_msg = m.get('foro', '')
-        
-        # Armamos un bloque con la info que tengamos disponible
-        meta_info = []
-        if fecha_msg: meta_info.append(f"Fecha: {fecha_msg}")
-        if curso_msg: meta_info.append(f"Curso: {curso_msg}")
-        if foro_msg: meta_info.append(f"Foro: {foro_msg}")
-        
-        meta_str = f" [{ ' | '.join(meta_info) }]" if meta_info else ""
-        
-        hilos[hilo_id].append(f"-{meta_str} {pseudonimo}: {texto}")
-        
-    textos_hilos = []
-    for hilo_id, msjs in hilos.items():
-        textos_hilos.append(f"--- HILO DE CONVERSACIÓN: {hilo_id} (Mensajes en orden cronológico) ---\n" + "\n".join(msjs))
-        
-    joined = "\n\n".join(textos_hilos)
+        snapshot = catalogo.snapshot()
+        resultados = [None] * len(preguntas)
+        trabajos = []
+        for i, pregunta in enumerate(preguntas):
+            pregunta = str(pregunta).strip()
+            entrada = snapshot.entrada_por_pregunta(pregunta)
+            if entrada is None:
+                resultados[i] = {"pregunta": pregunta, "status": "error",
+                                 "message": "⚠️ La pregunta no está en el catálogo."}
+                continue
+            if entrada.get("descripcion"):
+                # El análisis IA necesita consentimiento y es lento: va por /procesar
+                resultados[i] = {"pregunta": pregunta, "status": "error",
+                                 "message": "⚠️ Esta pregunta requiere análisis IA; usá /foro/procesar."}
+                continue
+            plantilla = _plantilla(entrada["sql"], snapshot)
+            if not plantilla.solo_lectura:
+                resultados[i] = {"pregunta": pregunta, "status": "error",
+                                 "message": "⚠️ Solo se permiten consultas de lectura (SELECT/WITH)."}
+                continue
+            sql_prepared, params, had_limit = plantilla.preparar(curso, page, size, None, ids_curso)
+            trabajos.append((i, (pregunta, entrada, sql_prepared, params, curso, page, size, had_limit, formato)))
+
+        with tramo("tablero"):
+            if _ejecutor_tablero is None:
+                # Secuencial (pool de una conexión): cada consulta tiene el tiempo que queda,
+                # en segundos enteros para no multiplicar las variantes de la SQL preparada
+                limite = time.monotonic() + TABLERO_TIMEOUT
+                for i, args in trabajos:
+                    restante = limite - time.monotonic()
+                    resultados[i] = (
+                        _consulta_tablero(*args, tiempo_max=math.ceil(restante)) if restante > 0
+                        else _timeout_tablero(args[0])
+                    )
+            else:
+                pendientes = {_ejecutor_tablero.submit(_consulta_tablero, *args): i for i, args in trabajos}
+                terminados, vencidos = wait(pendientes, timeout=TABLERO_TIMEOUT)
+                for futuro in terminados:
+                    resultados[pendientes[futuro]] = futuro.result()
+                for futuro in vencidos:
+                    # Si todavía no arrancó se descarta; si ya corre, MAX_EXECUTION_TIME la corta en la base
+                    futuro.cancel()
+                    i = pendientes[futuro]
+                    resultados[i] = _timeout_tablero(str(preguntas[i]).strip())
+
+        completo = all(r["status"] == "ok" for r in resultados)
+        return jsonify({
+            "status": "ok" if completo else "parcial",
+            "curso": curso,
+            "size": size,
+            "resultados": resultados,
+        })
+
+    except Exception as e:
+        print(f"❌ Error en tablero: {e}")
+        return jsonify({"status": "error", "message": f"Error: {str(e)}"}), 500
+
+
+# === Procesar IA (MOTOR ENTERPRISE CON CRONOLOGÍA DINÁMICA) ===
+def _preparar_analisis(descripcion, mensajes, query_sql=""):
+    """Anonimiza los mensajes y los planifica; devuelve (chunks, clave_cache, mapa_inverso)"""
+    # 1-3. ORDEN CRONOLÓGICO, PSEUDÓNIMOS Y REEMPLAZO EN UNA PASADA POR MENSAJE
+    hilos, mapa_inverso, variantes = anonimizar_hilos(mensajes, query_sql)
+    joined = unir_hilos(hilos)
 
     # 4. AUDITORÍA FINAL PARA GARANTIZAR QUE NO VIAJEN NOMBRES
-    fuga = detectar_fuga(joined, todas_las_variantes_generadas)
+    fuga = detectar_fuga(joined, variantes)
     if fuga:
         print(f"\n🚨 [ALERTA DE PRIVACIDAD] POSIBLE FUGA DETECTADA ANTES DE IA: Rastro de '{fuga}'\n")
-    
+
+    # Hilos agrupados en fragmentos que entran en el presupuesto de tokens
+    chunks = planificar_chunks(hilos, IA_TOKENS_CHUNK, IA_MODELO)
+
+    clave = digest_analisis(descripcion, joined, IA_MODELO, IA_TEMPERATURA)
+    return chunks, clave, mapa_inverso
+
+def _prompt_analisis(descripcion, texto, parte=None):
     marco = _cargar_marco_etico()
 
-    prompt = f"""
+    if parte:
+        alcance = (
+            f"\nEstos mensajes son el FRAGMENTO {parte[0]} de {parte[1]} del foro. "
+            "Analizá sólo este fragmento: otra etapa va a combinar los análisis parciales, "
+            "así que conservá los pseudónimos (Usuario_N) y las fechas relevantes.\n"
+        )
+    else:
+        alcance = ""
+
+    return f"""
 [MARCO ÉTICO]
 {marco}
 [FIN MARCO ÉTICO]
@@ -468,48 +694,196 @@ Sos un asistente educativo. Analizá los mensajes del foro según la siguiente c
 
 Instrucción original:
 {descripcion}
-
+{alcance}
 IMPORTANTE: Los mensajes que vas a leer están separados por hilo y en ORDEN CRONOLÓGICO EXACTO (de más antiguo a más nuevo).
 Si un mensaje más reciente tiene sentido como respuesta al contexto de un mensaje anterior (por ejemplo, alguien pregunta una fecha y otro responde "el martes"), asumí que la pregunta SÍ fue respondida, sin importar si no la citaron formalmente.
 Leé la conversación como si fuera un chat.
 
 Mensajes del foro (Anonimizados):
-{joined}
+{texto}
 
 Respuesta (clara y breve, como sugerencia que requiere revisión humana):
 """.strip()
 
-    # === ÚNICO PRINT LIMPIO PARA AUDITORÍA VISUAL ===
-    print("\n" + "▼" * 60)
-    print("👀 LO QUE VE LA IA (TEXTO EXACTO ENVIADO A OPENAI):")
-    print("-" * 60)
-    print(prompt)
-    print("-" * 60)
-    print("🏁 FIN DEL TEXTO ENVIADO A OPENAI")
-    print("▲" * 60 + "\n")
-    
-    log_to_file("Auditoría de Prompt", prompt, "Sistema_Interno")
-
-    # 5. ENVIAR A IA Y RECIBIR
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=600,
-            temperature=0.3
-        )
-        contenido = response.choices[0].message.content
-        
-        if not contenido or not contenido.strip():
-            return "🤖 La IA no encontró evidencia relevante."
-            
-        # 6. DESANONIMIZAR CON REGEX SEGURO Y DEVOLVER
-        respuesta_final = contenido.strip()
-        respuesta_final = desanonimizar_respuesta(respuesta_final, mapa_inverso)
-        return respuesta_final
+def _prompt_reduccion(descripcion, parciales):
+    marco = _cargar_marco_etico()
+    bloques = "\n\n".join(
+        f"--- ANÁLISIS PARCIAL {i} de {len(parciales)} ---\n{p}" for i, p in enumerate(parciales, 1)
+    )
+    return f"""
+[MARCO ÉTICO]
+{marco}
+[FIN MARCO ÉTICO]
+
+Sos un asistente educativo. El foro era demasiado extenso para leerlo de una vez, así que se analizó por fragmentos consecutivos (en orden cronológico).
+Combiná los análisis parciales en una única respuesta para la siguiente consigna, sin repetir hallazgos y manteniendo los pseudónimos tal como aparecen.
+Si un hilo aparece partido en varios fragmentos ("parte i/n"), tratalo como una sola conversación.
+
+Instrucción original:
+{descripcion}
+
+Análisis parciales:
+{bloques}
+
+Respuesta (clara y breve, como sugerencia que requiere revisión humana):
+""".strip()
+
+def _llamar_ia(prompt, stream=False):
+    return openai_client.obtener().chat.completions.create(
+        model=IA_MODELO,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=600,
+        temperature=IA_TEMPERATURA,
+        stream=stream
+    )
+
+def _analizar_parcial(descripcion, texto, parte):
+    clave = digest_analisis(descripcion, texto, IA_MODELO, IA_TEMPERATURA, parte)
+    contenido = analisis_cache.obtener(clave)
+    if contenido is None:
+        prompt = _prompt_analisis(descripcion, texto, parte)
+        _auditar_prompt(prompt)
+        contenido = (_llamar_ia(prompt).choices[0].message.content or "").strip()
+        analisis_cache.guardar(clave, contenido)
+    return contenido or "(sin hallazgos en este fragmento)"
+
+def _prompt_final(descripcion, chunks):
+    """Un solo chunk: prompt directo. Varios: map concurrente y prompt de reducción"""
+    if len(chunks) <= 1:
+        # Sin chunks (filas sin texto) el llamador ya cortó antes; se arma igual un prompt válido
+        return _prompt_analisis(descripcion, chunks[0] if chunks else "")
+
+    total = len(chunks)
+    with ThreadPoolExecutor(max_workers=min(IA_CONCURRENCIA, total)) as pool:
+        parciales = list(pool.map(
+            lambda args: _analizar_parcial(descripcion, args[1], (args[0], total)),
+            enumerate(chunks, 1)
+        ))
+    return _prompt_reduccion(descripcion, parciales)
+
+def _auditar_prompt(prompt):
+    """Registra el prompt en el log de auditoría según AUDITORIA_PROMPT"""
+    if AUDITORIA_PROMPT == "off" or not prompt:
+        return
+    crudo = prompt.encode("utf-8")
+    campos = {
+        "modelo": IA_MODELO,
+        "sha256": hashlib.sha256(crudo).hexdigest(),
+        "caracteres": len(prompt),
+        "bytes": len(crudo),
+        "tokens": contar_tokens(prompt, IA_MODELO),
+    }
+    if AUDITORIA_PROMPT == "completo" or (
+        AUDITORIA_PROMPT == "muestreo" and random.random() < AUDITORIA_MUESTREO
+    ):
+        campos["prompt"] = prompt
+    registro_auditoria.registrar("prompt", modo=AUDITORIA_PROMPT, **campos)
+
+SIN_MENSAJES = "⚠️ No se encontraron mensajes para analizar en este curso."
+
+def procesar_pregunta_ia(descripcion, mensajes, query_sql=""):
+    if not mensajes:
+        return SIN_MENSAJES
+
+    chunks, clave, mapa_inverso = _preparar_analisis(descripcion, mensajes, query_sql)
+    if not chunks:
+        # Filas sin campo `message` (o todas vacías): no hay nada que mandar a la IA
+        return SIN_MENSAJES
+
+    # 5. CONSULTAR CACHE; SI NO ESTÁ, ENVIAR A IA (MAP-REDUCE SI EL FORO NO ENTRA EN UN PROMPT)
+    contenido = analisis_cache.obtener(clave)
+
+    if contenido is None:
+        try:
+            prompt = _prompt_final(descripcion, chunks)
+            _auditar_prompt(prompt)
+            response = _llamar_ia(prompt)
+            contenido = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            return f"⚠️ Error al usar IA: {str(e)}"
+
+        if contenido:
+            analisis_cache.guardar(clave, contenido)
+
+    if not contenido:
+        return "🤖 La IA no encontró evidencia relevante."
+
+    # 6. DESANONIMIZAR CON REGEX SEGURO Y DEVOLVER (se hace siempre, también con cache)
+    return desanonimizar(contenido, mapa_inverso)
 
+def procesar_pregunta_ia_stream(descripcion, mensajes, query_sql=""):
+    """Como procesar_pregunta_ia, pero genera la respuesta de a fragmentos ya desanonimizados"""
+    if not mensajes:
+        yield SIN_MENSAJES
+        return
+
+    chunks, clave, mapa_inverso = _preparar_analisis(descripcion, mensajes, query_sql)
+    if not chunks:
+        yield SIN_MENSAJES
+        return
+
+    contenido = analisis_cache.obtener(clave)
+    if contenido is not None:
+        yield desanonimizar(contenido, mapa_inverso) if contenido else "🤖 La IA no encontró evidencia relevante."
+        return
+
+    partes = []
+    # Retiene la cola del buffer: un pseudónimo puede llegar partido entre fragmentos
+    desanonimizador = DesanonimizadorIncremental(mapa_inverso)
+    try:
+        # Con map-reduce sólo se transmite en vivo la etapa de reducción
+        prompt = _prompt_final(descripcion, chunks)
+        _auditar_prompt(prompt)
+        for chunk in _llamar_ia(prompt, stream=True):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                partes.append(delta)
+                listo = desanonimizador.agregar(delta)
+                if listo:
+                    yield listo
     except Exception as e:
-        return f"⚠️ Error al usar IA: {str(e)}"
+        yield f"⚠️ Error al usar IA: {str(e)}"
+        return
+
+    resto = desanonimizador.cerrar()
+    if resto:
+        yield resto
+
+    contenido = "".join(partes).strip()
+    if contenido:
+        analisis_cache.guardar(clave, contenido)
+    else:
+        yield "🤖 La IA no encontró evidencia relevante."
+
+def _respuesta_ia_stream(meta, fragmentos, al_terminar=None):
+    """Respuesta NDJSON: una línea meta, N líneas delta y una línea fin (o error)"""
+    def generar():
+        yield json.dumps({"tipo": "meta", **meta}, ensure_ascii=False, default=str) + "\n"
+        texto = []
+        t0 = time.perf_counter()
+        try:
+            for fragmento in fragmentos:
+                texto.append(fragmento)
+                yield json.dumps({"tipo": "delta", "texto": fragmento}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            print(f"❌ Error en streaming IA: {e}")
+            yield json.dumps({"tipo": "error", "message": f"Error: {str(e)}"}, ensure_ascii=False) + "\n"
+            return
+        registrar_etapa("ia", time.perf_counter() - t0)
+        if al_terminar:
+            al_terminar("".join(texto))
+        fin = {"tipo": "fin"}
+        if debug_pedido():
+            fin["trazas"] = trazas_actuales()
+        yield json.dumps(fin) + "\n"
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # === Resto del archivo ===
 @foro_bp.route("/")
@@ -521,18 +895,38 @@ def faq():
     if not check_access():   
         return jsonify({"error": "🔒 Acceso denegado"}), 403
     try:
-        with open("sql_base.json", "r", encoding="utf-8") as f:
-            base = json.load(f)
-
-        return jsonify({
-            "generales": [p.get("pregunta", "") for p in base.get("generales", [])],
-            "por_curso": [p.get("pregunta", "") for p in base.get("por_curso", [])],
-            "generales_ia": [p.get("pregunta", "") for p in base.get("generales_ia", [])],
-            "por_curso_ia": [p.get("pregunta", "") for p in base.get("por_curso_ia", [])]
-        })
+        return jsonify(dict(catalogo.snapshot().faq))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@foro_bp.route("/cache/stats")
+def cache_stats():
+    if not check_access():
+        return jsonify({"error": "🔒 Acceso denegado"}), 403
+    return jsonify({
+        "sql": cache_resultados.estadisticas(),
+        "ia": analisis_cache.estadisticas(),
+        "pool": db.estadisticas(),
+        "auditoria": registro_auditoria.estadisticas(),
+        "coalescencia": coalescedor.estadisticas(),
+    })
+
+@foro_bp.route("/arranque")
+def arranque():
+    """Tiempos de inicialización por componente y recursos aún sin cargar"""
+    if not check_access():
+        return jsonify({"error": "🔒 Acceso denegado"}), 403
+    return jsonify(informe_arranque())
+
+@foro_bp.route("/cache/invalidar", methods=["POST"])
+def cache_invalidar():
+    if not check_access():
+        return jsonify({"error": "🔒 Acceso denegado"}), 403
+    data = request.get_json(silent=True) or {}
+    curso = (data.get("curso") or "").strip()
+    borradas = cache_resultados.invalidar_curso(curso) if curso else cache_resultados.limpiar()
+    return jsonify({"status": "ok", "curso": curso or None, "invalidadas": borradas})
+
 @foro_bp.route("/chat", methods=["POST"])
 def chat():
     if not check_access():   
@@ -552,6 +946,9 @@ def chat():
 
         consent_ia = bool(data.get("consentIA", True))
         guardar = bool(data.get("guardar", False))
+        stream = bool(data.get("stream", False))
+        cursor_keyset = data.get("cursor")
+        formato = data.get("formato")
 
         if seleccion is not None and sugerencias:
             idx = int(seleccion) - 1
@@ -564,39 +961,88 @@ def chat():
                 [line for line in sql_raw.splitlines() if not line.strip().startswith("--")]
             ).strip()
 
-            if not es_solo_lectura(sql_raw):
+            # TTL y keyset salen del catálogo, nunca de lo que manda el cliente
+            snapshot = catalogo.snapshot()
+            entrada = snapshot.entrada_por_sql(sql_raw)
+            plantilla = _plantilla(sql_raw, snapshot)
+            if not plantilla.solo_lectura:
                 return jsonify({"status": "error", "message": "Consulta no permitida"}), 400
 
-            sql_prepared, params, had_limit = _prepare_sql_and_params(sql_raw, curso, page, size)
-            with get_conn() as conn, conn.cursor(dictionary=True) as cursor:
-                cursor.execute(sql_prepared, params or None)
-                resultados = cursor.fetchall()
+            keyset = plantilla.keyset
+            sql_prepared, params, had_limit = plantilla.preparar(
+                curso, page, size, cursor_keyset, ids_curso
+            )
+
+            if stream and not (elegido.get("descripcion") and consent_ia):
+                return _respuesta_filas_stream(
+                    {
+                        "status": "ok",
+                        "ia": False,
+                        "query": sql_prepared,
+                        "params": params,
+                        "page": page,
+                        "size": size,
+                    },
+                    sql_prepared, params, page, size, had_limit, keyset,
+                    (lambda total: log_to_file(f"Selección {seleccion}", f"SQL: {sql_prepared}", curso)) if guardar else None,
+                    formato=formato, ttl=_ttl_entrada(entrada), curso=curso
+                )
+
+            if stream and elegido.get("descripcion") and consent_ia:
+                resumen, fragmentos = _analisis_ia_compartido(
+                    elegido["descripcion"], sql_prepared, params, curso, page, size, had_limit,
+                    _ttl_entrada(entrada)
+                )
+                return _respuesta_ia_stream(
+                    {
+                        "status": "ok",
+                        "ia": True,
+                        "query": sql_prepared,
+                        "params": params,
+                        "page": page,
+                        "size": size,
+                        **resumen
+                    },
+                    fragmentos,
+                    (lambda texto: log_to_file(f"Selección {seleccion}", f"SQL (IA): {sql_prepared}", curso))
+                    if guardar else None
+                )
+
+            resultados = _ejecutar_consulta(
+                sql_prepared, params, curso, page, size, _ttl_entrada(entrada)
+            )
 
             if elegido.get("descripcion") and consent_ia:
                 descripcion = elegido["descripcion"]
-                # 🚀 LE PASAMOS LA CONSULTA SQL PARA QUE DETERMINE EL ORDEN CRONOLÓGICO
-                respuesta_ia = procesar_pregunta_ia(descripcion, resultados, sql_prepared)
-                
-                if guardar:
-                    log_to_file(f"Selección {seleccion}", f"SQL (IA): {sql_prepared}", curso)
-
-                return jsonify({
+                meta = {
                     "status": "ok",
                     "ia": True,
-                    "respuesta": [{"Análisis IA": respuesta_ia}],
                     "query": sql_prepared,
                     "params": params,
                     "page": page,
                     "size": size,
                     "count": len(resultados),
                     "has_more": (len(resultados) == size) and (not had_limit)
-                })
+                }
+                registrar = (
+                    lambda: log_to_file(f"Selección {seleccion}", f"SQL (IA): {sql_prepared}", curso)
+                ) if guardar else None
+
+                # 🚀 LE PASAMOS LA CONSULTA SQL PARA QUE DETERMINE EL ORDEN CRONOLÓGICO
+                with tramo("ia"):
+                    respuesta_ia = procesar_pregunta_ia(descripcion, resultados, sql_prepared)
+
+                if registrar:
+                    registrar()
+
+                return jsonify({**meta, "respuesta": [{"Análisis IA": respuesta_ia}]})
 
-            data_final = serializar_resultado(resultados)
+            data_final = _serializar(resultados, sql_prepared, formato)
             if guardar:
                 log_to_file(f"Selección {seleccion}", f"SQL: {sql_prepared}", curso)
 
-            return jsonify({
+            has_more = (len(resultados) == size) and (not had_limit)
+            respuesta = {
                 "status": "ok",
                 "ia": False,
                 "respuesta": data_final,
@@ -605,25 +1051,25 @@ def chat():
                 "page": page,
                 "size": size,
                 "count": len(resultados),
-                "has_more": (len(resultados) == size) and (not had_limit)
-            })
-
-        preguntas_json = cargar_preguntas()
-        if "__CURSO__" in mensaje or curso:
-            todas = preguntas_json.get("por_curso", []) + preguntas_json.get("por_curso_ia", [])
-        else:
-            todas = preguntas_json.get("generales", []) + preguntas_json.get("generales_ia", [])
-
-        match = encontrar_pregunta_similar(mensaje, todas)
+                "has_more": has_more
+            }
+            if keyset:
+                respuesta["next_cursor"] = _siguiente_cursor(
+                    resultados[-1] if resultados else None, keyset, has_more
+                )
+            return jsonify(respuesta)
+
+        snapshot = catalogo.snapshot()
+        con_curso = "__CURSO__" in mensaje or bool(curso)
+
+        match, top, etapa = recuperar_preguntas(
+            mensaje, snapshot, con_curso, usar_ia=consent_ia, top_k=5
+        )
         if match:
             return jsonify({"status": "sugerencias", "sugerencias": [match]})
 
-        top_candidatos = buscar_semantico(mensaje, todas, top_k=5)
-
-        if consent_ia and top_candidatos:
-            top = rerank_con_ia(mensaje, top_candidatos)
-        else:
-            top = top_candidatos[:3]  
+        if etapa == "embeddings":
+            top = top[:3]
 
         return jsonify({
             "status": "sugerencias",
@@ -638,60 +1084,101 @@ def chat():
             ]
         })
 
+    except PoolAgotado as e:
+        return respuesta_agotado(e)
     except Exception as e:
         print(f"❌ Error en /foro/chat: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# === Recuperación: fuzzy → embeddings → rerank IA (cada etapa a lo sumo una vez por request) ===
+RERANK_MARGEN = float(os.getenv("RERANK_MARGEN", "0.15"))
+
+_etapas_lock = threading.Lock()
+fuzzy_cache = TTLCache(maxsize=2048, ttl=3600)
+embedding_cache = TTLCache(maxsize=2048, ttl=3600)
+rerank_cache = TTLCache(maxsize=1024, ttl=3600)
+
+def _cache_etapa(cache, clave, calcular):
+    with _etapas_lock:
+        if clave in cache:
+            return cache[clave]
+    valor = calcular()
+    with _etapas_lock:
+        cache[clave] = valor
+    return valor
+
+def recuperar_preguntas(texto, snapshot, con_curso, usar_fuzzy=True, usar_ia=False, top_k=5):
+    """
+    Devuelve (match, candidatos, etapa).
+    - fuzzy: coincidencia casi exacta con el catálogo -> match
+    - embeddings: top_k por similitud coseno contra el índice
+    - rerank: sólo con consentimiento IA y si el margen top1-top2 no es decisivo
+    """
+    preguntas = snapshot.preguntas_para(con_curso)
+    texto_norm = " ".join(texto.lower().split())
+    base = (snapshot.version, con_curso, texto_norm)
+
+    if usar_fuzzy:
+        with tramo("fuzzy"):
+            match = _cache_etapa(
+                fuzzy_cache, base, lambda: encontrar_pregunta_similar(texto, preguntas)
+            )
+        if match:
+            return match, [match], "fuzzy"
+
+    validas = [p for p in preguntas if p.get("pregunta")]
+    try:
+        with tramo("embeddings"):
+            top = _cache_etapa(
+                embedding_cache, base + (top_k,), lambda: _buscar_semantico_scores(texto, validas, top_k, snapshot)
+            )
+    except Exception as e:
+        print(f"⚠️ Error en búsqueda semántica: {e}")
+        top = []
+    candidatos = [validas[i] for i, _ in top]
+
+    if not usar_ia or not candidatos:
+        return None, candidatos, "embeddings"
+    if len(top) >= 2 and top[0][1] - top[1][1] >= RERANK_MARGEN:
+        return None, candidatos, "embeddings_decisivo"
+    with tramo("rerank"):
+        candidatos = rerank_con_ia(texto, candidatos)
+    return None, candidatos, "rerank"
+
+def _buscar_semantico_scores(mensaje, validas, top_k, snapshot=None):
+    snapshot = snapshot or catalogo.snapshot()
+    candidatos = [p["pregunta"] for p in validas]
+    if cliente_embeddings is not None:
+        top = cliente_embeddings.buscar(
+            mensaje, candidatos, top_k, snapshot.version,
+            lambda: [p.get("pregunta", "") for p in snapshot.todas()]
+        )
+        if top is not None:
+            return top
+    _asegurar_indice(snapshot)
+    return indice_semantico.buscar(mensaje, candidatos, top_k=top_k)
+
 def buscar_semantico(mensaje, preguntas, top_k=10):
+    """Etapa de embeddings: top_k preguntas por similitud (sin rerank IA)"""
     if not preguntas or not mensaje:
         return []
 
-    corpus = [p.get("pregunta", "") for p in preguntas if p.get("pregunta")]
-    if not corpus:
+    validas = [p for p in preguntas if p.get("pregunta")]
+    if not validas:
         return []
 
     try:
-        emb_corpus = modelo_embed.encode(corpus, convert_to_tensor=True)
-        emb_msj = modelo_embed.encode(mensaje, convert_to_tensor=True)
-        cos_scores = util.cos_sim(emb_msj, emb_corpus)[0]
-
-        top_idx = cos_scores.topk(min(top_k, len(corpus))).indices.tolist()
-        candidatos = [preguntas[i] for i in top_idx]
-
-        return rerank_con_ia(mensaje, candidatos)
-
+        return [validas[i] for i, _ in _buscar_semantico_scores(mensaje, validas, top_k)]
     except Exception as e:
         return []
 
-def cargar_preguntas():
-    base_path = os.path.dirname(__file__)
-    archivos = [
-        os.path.join(base_path, "sql_base.json"),
-        os.path.join(base_path, "sql_ejemplos.json"),
-    ]
-
-    preguntas = {
-        "generales": [],
-        "por_curso": [],
-        "generales_ia": [],
-        "por_curso_ia": []
-    }
-
-    for archivo in archivos:
-        if os.path.exists(archivo):
-            try:
-                with open(archivo, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        for clave in preguntas.keys():
-                            if clave in data and isinstance(data[clave], list):
-                                preguntas[clave].extend(data[clave])
-            except json.JSONDecodeError:
-                pass
-            except Exception as e:
-                pass
-
-    return preguntas
+def _asegurar_indice(snapshot=None):
+    """Carga (o reconstruye incrementalmente) el índice de la versión actual del catálogo"""
+    snapshot = snapshot or catalogo.snapshot()
+    if indice_semantico.version and indice_semantico.version.endswith(snapshot.version):
+        return
+    textos = [p.get("pregunta", "") for p in snapshot.todas()]
+    indice_semantico.asegurar(snapshot.version, textos)
 
 def encontrar_pregunta_similar(pregunta_usuario, preguntas_posibles, umbral=85):
     if not preguntas_posibles or not pregunta_usuario:
@@ -739,20 +1226,46 @@ Instrucciones para vos (IA):
 - Responde SOLO con los números separados por coma (ej: "1,3,4").
 """
 
-    try:
-        resp = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=30,
-            temperature=0
-        )
-        contenido = (resp.choices[0].message.content or "").strip().lower()
+    clave = digest_analisis(pregunta_usuario, prompt)
+    with _etapas_lock:
+        idxs = rerank_cache.get(clave)
+
+    if idxs is None:
+        try:
+            resp = openai_client.obtener().chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=30,
+                temperature=0
+            )
+            contenido = (resp.choices[0].message.content or "").strip().lower()
+        except Exception as e:
+            return candidatas[:3]
 
         if not contenido or contenido in ["0", "ninguna", "n/a"]:
-            return []
-
-        idxs = [int(x)-1 for x in contenido.split(",") if x.strip().isdigit()]
-        return [candidatas[i] for i in idxs if 0 <= i < len(candidatas)]
-
+            idxs = []
+        else:
+            idxs = [int(x)-1 for x in contenido.split(",") if x.strip().isdigit()]
+        with _etapas_lock:
+            rerank_cache[clave] = idxs
+
+    return [candidatas[i] for i in idxs if 0 <= i < len(candidatas)]
+
+def precargar():
+    """Carga el modelo y el índice ya mismo (master de Gunicorn con preload_app)"""
+    if cliente_embeddings is not None:
+        # El modelo vive en el sidecar
+        return
+    modelo_embed.obtener()
+    with medir("índice de embeddings"):
+        _asegurar_indice()
+
+# Índice de embeddings listo al arrancar el worker (sólo abre el .npy con mmap;
+# el modelo se carga recién si hay preguntas nuevas que codificar). Con sidecar
+# el índice lo arma el sidecar y el local se prepara sólo si hace falta
+if cliente_embeddings is None:
+    try:
+        with medir("índice de embeddings"):
+            _asegurar_indice()
     except Exception as e:
-        return candidatas[:3]
+        print(f"⚠️ No se pudo preparar el índice de embeddings: {e}")
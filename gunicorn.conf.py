@@ -0,0 +1,87 @@
+# Configuración de Gunicorn (se lee automáticamente desde el directorio de trabajo)
+#
+#   gunicorn app:application
+#
+# GUNICORN_PRELOAD=1 importa la app en el master y carga ahí el modelo de
+# embeddings: los workers lo heredan por fork (copy-on-write) en lugar de
+# cargarlo cada uno. Los pools de MySQL y el cliente OpenAI se crean igual
+# por worker.
+#
+# EMBED_SIDECAR=1 arranca servidor_embeddings.py junto con el master: un único
+# proceso con el modelo que atiende a todos los workers por un socket Unix.
+#
+# ASYNC_MODE=gevent cambia a workers gevent: las esperas de red (MySQL, OpenAI)
+# ceden el control, así un worker mantiene decenas de análisis IA en vuelo
+# sin bloquear las consultas que sólo van a la base.
+import os
+import sys
+import time
+import subprocess
+
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path="/home/asistenteia/.env")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+if os.getenv("ASYNC_MODE", "").lower() == "gevent":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+else:
+    worker_class = "sync"
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "").lower() in ("1", "true", "si", "sí")
+
+
+def when_ready(server):
+    # Corre en el master antes de crear los workers
+    if server.cfg.preload_app:
+        import foro
+        from recursos import imprimir_informe
+        foro.precargar()
+        imprimir_informe("Precarga en el master")
+
+
+def post_fork(server, worker):
+    from recursos import reiniciar_tras_fork
+    reiniciar_tras_fork()
+
+
+# === Sidecar de embeddings ===
+EMBED_SIDECAR = os.getenv("EMBED_SIDECAR", "").lower() in ("1", "true", "si", "sí")
+SIDECAR_ESPERA = float(os.getenv("EMBED_SIDECAR_ESPERA", "120"))
+
+
+def on_starting(server):
+    if not EMBED_SIDECAR:
+        return
+    from servidor_embeddings import ClienteEmbeddings, ruta_socket_defecto
+
+    ruta = ruta_socket_defecto()
+    # Los workers heredan la ruta por el entorno
+    os.environ["EMBED_SOCKET"] = ruta
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor_embeddings.py")
+    server.sidecar = subprocess.Popen([sys.executable, script, "--socket", ruta])
+
+    # Se espera a que el modelo esté cargado para no arrancar workers que
+    # caerían al modelo local
+    cliente = ClienteEmbeddings(ruta, espera_reintento=0)
+    limite = time.monotonic() + SIDECAR_ESPERA
+    while time.monotonic() < limite and server.sidecar.poll() is None:
+        if os.path.exists(ruta) and cliente.ping():
+            server.log.info("Sidecar de embeddings listo (pid %s)", server.sidecar.pid)
+            return
+        time.sleep(0.5)
+    server.log.warning("El sidecar de embeddings no respondió; los workers usarán el modelo local")
+
+
+def on_exit(server):
+    sidecar = getattr(server, "sidecar", None)
+    if sidecar is not None and sidecar.poll() is None:
+        sidecar.terminate()
+        try:
+            sidecar.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            sidecar.kill()
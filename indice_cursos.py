@@ -0,0 +1,140 @@
+"""
+Índice en memoria para buscar cursos por nombre (typeahead de /curso/buscar).
+
+Los nombres se normalizan como en el anonimizador (minúsculas, sin acentos)
+y se indexan de dos formas:
+- palabras ordenadas: cada palabra de la consulta se busca como prefijo con
+  bisect ("prog int" encuentra "Programación Introductoria");
+- trigramas: si las palabras no coinciden como prefijo (typos, subcadenas) se
+  ordena por la fracción de trigramas de la consulta presentes en el nombre.
+
+Se actualiza de forma incremental a partir de la lista de cursos cacheada:
+sólo se agregan/quitan los nombres que cambiaron desde la última versión.
+"""
+
+import re
+import threading
+from bisect import bisect_left, insort
+
+from anonimizador import sin_acentos
+
+_PALABRA = re.compile(r"\w+")
+
+
+def normalizar(texto):
+    return " ".join(_PALABRA.findall(sin_acentos((texto or "").lower())))
+
+
+def trigramas(texto):
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceCursos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self._normalizados = {}   # nombre -> normalizado
+        self._palabras = []       # palabras distintas, ordenadas (para bisect)
+        self._por_palabra = {}    # palabra -> {nombres}
+        self._por_trigrama = {}   # trigrama -> {nombres}
+
+    # --- Construcción incremental ---
+    def _agregar(self, nombre):
+        norm = normalizar(nombre)
+        self._normalizados[nombre] = norm
+        for palabra in set(norm.split()):
+            if palabra not in self._por_palabra:
+                insort(self._palabras, palabra)
+            self._por_palabra.setdefault(palabra, set()).add(nombre)
+        for tri in trigramas(norm):
+            self._por_trigrama.setdefault(tri, set()).add(nombre)
+
+    def _quitar(self, nombre):
+        norm = self._normalizados.pop(nombre)
+        for palabra in set(norm.split()):
+            nombres = self._por_palabra[palabra]
+            nombres.discard(nombre)
+            if not nombres:
+                del self._por_palabra[palabra]
+                del self._palabras[bisect_left(self._palabras, palabra)]
+        for tri in trigramas(norm):
+            nombres = self._por_trigrama[tri]
+            nombres.discard(nombre)
+            if not nombres:
+                del self._por_trigrama[tri]
+
+    def actualizar(self, cursos, version):
+        """Sincroniza el índice con la lista de cursos; no hace nada si `version` no cambió"""
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            nuevos = set(cursos)
+            actuales = set(self._normalizados)
+            for nombre in actuales - nuevos:
+                self._quitar(nombre)
+            for nombre in nuevos - actuales:
+                self._agregar(nombre)
+            self.version = version
+
+    # --- Búsqueda ---
+    def _con_prefijo(self, prefijo):
+        nombres = set()
+        i = bisect_left(self._palabras, prefijo)
+        while i < len(self._palabras) and self._palabras[i].startswith(prefijo):
+            nombres |= self._por_palabra[self._palabras[i]]
+            i += 1
+        return nombres
+
+    @staticmethod
+    def _puntaje(consulta, norm, similitud=None):
+        if norm == consulta:
+            return 100.0
+        if norm.startswith(consulta):
+            return 90.0
+        palabras_nombre, palabras_consulta = norm.split(), consulta.split()
+        if len(palabras_consulta) <= len(palabras_nombre) and all(
+            n.startswith(c) for n, c in zip(palabras_nombre, palabras_consulta)
+        ):
+            return 85.0   # "prog int" -> "programacion introductoria"
+        if consulta in norm:
+            return 80.0
+        if similitud is None:
+            return 70.0   # todas las palabras coinciden como prefijo
+        return 60.0 * similitud
+
+    def buscar(self, consulta, limite=20):
+        """[(nombre, puntaje)] ordenados por relevancia"""
+        q = normalizar(consulta)
+        if not q:
+            return []
+        with self._lock:
+            palabras = q.split()
+            candidatos = self._con_prefijo(palabras[0])
+            for palabra in palabras[1:]:
+                if not candidatos:
+                    break
+                candidatos &= self._con_prefijo(palabra)
+
+            if candidatos:
+                puntajes = {n: self._puntaje(q, self._normalizados[n]) for n in candidatos}
+            else:
+                # Sin coincidencias por prefijo: similitud por trigramas (tolera typos)
+                tris = trigramas(q)
+                comunes = {}
+                for tri in tris:
+                    for nombre in self._por_trigrama.get(tri, ()):
+                        comunes[nombre] = comunes.get(nombre, 0) + 1
+                puntajes = {}
+                for nombre, n in comunes.items():
+                    similitud = n / len(tris)   # fracción de la consulta presente en el nombre
+                    if similitud >= 0.5:
+                        puntajes[nombre] = self._puntaje(q, self._normalizados[nombre], similitud)
+
+        ordenados = sorted(puntajes.items(), key=lambda x: (-x[1], len(x[0]), x[0]))
+        return [(nombre, round(p, 1)) for nombre, p in ordenados[:limite]]
+
+    def __len__(self):
+        return len(self._normalizados)
@@ -0,0 +1,159 @@
+"""
+Índice de embeddings persistido para el catálogo de preguntas.
+
+Los vectores se calculan una sola vez por versión del catálogo y se guardan
+en disco como una matriz float32 (.npy) que cada worker abre con mmap.
+Cuando cambia el catálogo sólo se codifican las preguntas nuevas o editadas;
+el resto de las filas se reutiliza del índice anterior.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+# Índice abierto: se publica entero con una sola asignación, así `buscar`
+# nunca combina la matriz de una versión con las filas de otra
+EstadoIndice = namedtuple("EstadoIndice", ("version", "matriz", "filas"))
+_VACIO = EstadoIndice(None, None, MappingProxyType({}))
+
+
+def clave_texto(texto: str) -> str:
+    """Hash estable de una pregunta (identifica su fila en el índice)"""
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+class IndiceSemantico:
+    def __init__(self, codificar, directorio, nombre_modelo=""):
+        # codificar(lista_de_textos) -> np.ndarray (n, d) normalizado
+        self._codificar = codificar
+        self.directorio = directorio
+        self.nombre_modelo = nombre_modelo
+        self.estado = _VACIO
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.estado.version
+
+    # --- Persistencia ---
+    def _ruta_manifiesto(self):
+        return os.path.join(self.directorio, "indice_actual.json")
+
+    def _leer_manifiesto(self):
+        try:
+            with open(self._ruta_manifiesto(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _abrir(self, manifiesto):
+        ruta = os.path.join(self.directorio, manifiesto["matriz"])
+        matriz = np.load(ruta, mmap_mode="r")
+        claves = manifiesto["claves"]
+        if matriz.shape[0] != len(claves):
+            raise ValueError("Índice inconsistente: filas y claves no coinciden")
+        filas = MappingProxyType({c: i for i, c in enumerate(claves)})
+        self.estado = EstadoIndice(manifiesto["version"], matriz, filas)
+
+    # --- Construcción ---
+    def asegurar(self, version, textos):
+        """Deja cargado el índice de `version`; lo reconstruye si hace falta"""
+        version = f"{self.nombre_modelo}:{version}"
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version == version:
+                return
+            manifiesto = self._leer_manifiesto()
+            if manifiesto and manifiesto.get("version") == version:
+                try:
+                    self._abrir(manifiesto)
+                    return
+                except Exception as e:
+                    print(f"⚠️ Índice de embeddings ilegible, se reconstruye: {e}")
+            self._reconstruir(version, textos, manifiesto)
+
+    def _reconstruir(self, version, textos, anterior):
+        os.makedirs(self.directorio, exist_ok=True)
+
+        unicos = list(dict.fromkeys(t for t in textos if t))
+        claves = [clave_texto(t) for t in unicos]
+
+        # Reutilizar las filas del índice anterior (mismo modelo)
+        previas, filas_previas = None, {}
+        if anterior and anterior.get("version", "").split(":")[0] == self.nombre_modelo:
+            try:
+                previas = np.load(os.path.join(self.directorio, anterior["matriz"]), mmap_mode="r")
+                filas_previas = {c: i for i, c in enumerate(anterior["claves"])}
+            except Exception:
+                previas, filas_previas = None, {}
+
+        faltantes = [i for i, c in enumerate(claves) if c not in filas_previas]
+        nuevos = None
+        if faltantes:
+            nuevos = np.asarray(self._codificar([unicos[i] for i in faltantes]), dtype=np.float32)
+
+        dim = nuevos.shape[1] if nuevos is not None else (previas.shape[1] if previas is not None else 0)
+        matriz = np.zeros((len(unicos), dim), dtype=np.float32)
+        for i, c in enumerate(claves):
+            if c in filas_previas:
+                matriz[i] = previas[filas_previas[c]]
+        if nuevos is not None:
+            matriz[faltantes] = nuevos
+
+        digest = hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+        nombre_matriz = f"indice_{digest}.npy"
+        ruta_matriz = os.path.join(self.directorio, nombre_matriz)
+        tmp = f"{ruta_matriz}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, matriz)
+        os.replace(tmp, ruta_matriz)
+
+        manifiesto = {"version": version, "matriz": nombre_matriz, "claves": claves}
+        tmp = f"{self._ruta_manifiesto()}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f)
+        os.replace(tmp, self._ruta_manifiesto())
+
+        # La matriz anterior ya no se usa (los workers que la tengan en mmap no se ven afectados)
+        if anterior and anterior.get("matriz") and anterior["matriz"] != nombre_matriz:
+            try:
+                os.remove(os.path.join(self.directorio, anterior["matriz"]))
+            except OSError:
+                pass
+
+        print(f"🧭 Índice de embeddings: {len(unicos)} preguntas ({len(faltantes)} codificadas)")
+        self._abrir(manifiesto)
+
+    # --- Consulta ---
+    def buscar(self, texto, candidatos, top_k=10):
+        """Devuelve [(posición_en_candidatos, score)] ordenado por similitud"""
+        if not texto or not candidatos:
+            return []
+        consulta = np.asarray(self._codificar([texto]), dtype=np.float32)[0]
+
+        _, matriz, filas = self.estado
+        idx = [filas.get(clave_texto(t)) for t in candidatos]
+        ausentes = [i for i, fila in enumerate(idx) if fila is None]
+        if matriz is None or ausentes:
+            # Preguntas fuera del índice: se codifican al vuelo
+            vectores = np.empty((len(candidatos), consulta.shape[0]), dtype=np.float32)
+            presentes = [i for i, fila in enumerate(idx) if fila is not None]
+            if presentes:
+                vectores[presentes] = matriz[[idx[i] for i in presentes]]
+            if ausentes:
+                vectores[ausentes] = np.asarray(
+                    self._codificar([candidatos[i] for i in ausentes]), dtype=np.float32
+                )
+        else:
+            vectores = matriz[idx]
+
+        scores = vectores @ consulta
+        k = min(top_k, len(candidatos))
+        orden = np.argsort(-scores, kind="stable")[:k]
+        return [(int(i), float(scores[i])) for i in orden]
@@ -0,0 +1,88 @@
+"""
+Planificación de prompts por presupuesto de tokens.
+
+Mide los hilos anonimizados y los agrupa en fragmentos (chunks) que entran en
+el presupuesto, respetando los límites de cada hilo y el orden cronológico.
+Un hilo que por sí solo excede el presupuesto se parte en tramos
+consecutivos ("parte i/n").
+"""
+
+from functools import lru_cache
+
+from anonimizador import formatear_hilo
+
+try:
+    import tiktoken
+except ImportError:  # dependencia opcional: sin tiktoken se estima por caracteres
+    tiktoken = None
+
+
+@lru_cache(maxsize=8)
+def _codificador(modelo):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+
+def contar_tokens(texto, modelo="gpt-4o-mini"):
+    if not texto:
+        return 0
+    enc = _codificador(modelo)
+    if enc is None:
+        # ~4 caracteres por token es una buena aproximación para español
+        return len(texto) // 4 + 1
+    return len(enc.encode(texto, disallowed_special=()))
+
+
+def _partir_hilo(hilo_id, lineas, presupuesto, modelo):
+    encabezado = contar_tokens(formatear_hilo(f"{hilo_id} (parte 99/99)", []), modelo)
+    disponible = max(1, presupuesto - encabezado)
+
+    partes, actual, usados = [], [], 0
+    for linea in lineas:
+        t = contar_tokens(linea, modelo) + 1
+        if actual and usados + t > disponible:
+            partes.append(actual)
+            actual, usados = [], 0
+        actual.append(linea)
+        usados += t
+    if actual:
+        partes.append(actual)
+
+    return [
+        formatear_hilo(f"{hilo_id} (parte {i}/{len(partes)})", p)
+        for i, p in enumerate(partes, 1)
+    ]
+
+
+def planificar_chunks(hilos, presupuesto, modelo="gpt-4o-mini"):
+    """
+    Devuelve la lista de textos a analizar. Con un solo chunk el texto es
+    idéntico a unir_hilos(hilos).
+    """
+    bloques = []
+    for hilo_id, lineas in hilos.items():
+        texto = formatear_hilo(hilo_id, lineas)
+        tokens = contar_tokens(texto, modelo)
+        if tokens <= presupuesto:
+            bloques.append((texto, tokens))
+        else:
+            for parte in _partir_hilo(hilo_id, lineas, presupuesto, modelo):
+                bloques.append((parte, contar_tokens(parte, modelo)))
+
+    chunks, actual, usados = [], [], 0
+    for texto, tokens in bloques:
+        if actual and usados + tokens > presupuesto:
+            chunks.append("\n\n".join(actual))
+            actual, usados = [], 0
+        actual.append(texto)
+        usados += tokens + 1
+    if actual:
+        chunks.append("\n\n".join(actual))
+    return chunks
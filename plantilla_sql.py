@@ -0,0 +1,140 @@
+"""
+Plantillas SQL precompiladas.
+
+Cada SQL del catálogo se compila una sola vez (al cargar el catálogo):
+{PREFIX} resuelto, las marcas __CURSO__, __CURSO_ID__ y __KEYSET__ (y la
+reescritura de `course = __CURSO__`) convertidas en huecos, el LIMIT
+detectado y el veredicto de sólo lectura calculado. Por request sólo se
+completan los parámetros.
+
+La SQL final de cada "forma" (con o sin curso, cantidad de ids, con o sin
+cursor de keyset) se arma la primera vez y después se devuelve el mismo
+objeto str, así la sentencia preparada que guarda la conexión se reutiliza
+sin volver a prepararla en el servidor (ver db.consulta).
+"""
+
+import re
+from functools import lru_cache
+
+LEER_REGEX = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_LIMIT = re.compile(r"\blimit\s+\d+", re.IGNORECASE)
+_SELECT_INICIAL = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+_MARCAS = re.compile(
+    r"(?i:(\b(?:\w+\.)?course\s*)=\s*)(?:(['\"])__CURSO__\2|\b__CURSO__\b)"
+    r"|(['\"])__CURSO__\3|\b__CURSO__\b|\b__CURSO_ID__\b|\b__KEYSET__\b"
+)
+
+CURSO, CURSO_ID, CURSO_IGUAL, KEYSET = "curso", "curso_id", "curso_igual", "keyset"
+
+
+def es_solo_lectura(sql: str) -> bool:
+    if not sql:
+        return False
+    partes = [p.strip() for p in sql.split(';') if p.strip()]
+    return bool(partes) and all(LEER_REGEX.match(sent) for sent in partes)
+
+
+@lru_cache(maxsize=512)
+def con_tiempo_maximo(sql, ms):
+    """
+    Agrega el hint MAX_EXECUTION_TIME (MySQL 5.7+) al SELECT inicial. Las
+    consultas WITH quedan igual (el hint iría en el SELECT interno). Cacheado:
+    la misma SQL devuelve el mismo objeto str (sentencia preparada reutilizable).
+    """
+    return _SELECT_INICIAL.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({int(ms)}) */", sql, count=1)
+
+
+class PlantillaSQL:
+    __slots__ = ("prefijo", "partes", "tiene_limit", "solo_lectura", "keyset", "usa_keyset",
+                 "usa_curso_id", "_formas")
+
+    def __init__(self, sql_raw, prefijo, keyset=None):
+        sql = (sql_raw or "").replace("{PREFIX}", prefijo).strip()
+        self.prefijo = prefijo
+        partes, inicio = [], 0
+        for m in _MARCAS.finditer(sql):
+            partes.append(sql[inicio:m.start()])
+            marca = m.group(0)
+            if m.group(1) is not None:
+                partes.append((CURSO_IGUAL, m.group(1)))
+            elif marca == "__CURSO_ID__":
+                partes.append((CURSO_ID,))
+            elif marca == "__KEYSET__":
+                partes.append((KEYSET,))
+            else:
+                partes.append((CURSO,))
+            inicio = m.end()
+        partes.append(sql[inicio:])
+        self.partes = tuple(p for p in partes if p != "")
+
+        texto = "".join(p if isinstance(p, str) else "%s" for p in self.partes)
+        self.tiene_limit = bool(_LIMIT.search(texto))
+        self.solo_lectura = es_solo_lectura(texto)
+        huecos = {p[0] for p in self.partes if not isinstance(p, str)}
+        # Paginación por clave: la entrada declara la columna y la SQL marca con __KEYSET__ dónde va
+        self.keyset = keyset if keyset and keyset.get("columna") else None
+        self.usa_keyset = self.keyset is not None and KEYSET in huecos
+        self.usa_curso_id = bool(huecos & {CURSO_ID, CURSO_IGUAL})
+        self._formas = {}
+
+    def _filtro_ids(self, forma_ids):
+        if forma_ids is None:
+            return "(NULL)"
+        if forma_ids == 0:
+            # Curso fuera de la lista cacheada (recién creado, base sin cache): subconsulta
+            return f"(SELECT id FROM {self.prefijo}course WHERE fullname = %s)"
+        return "(" + ", ".join(["%s"] * forma_ids) + ")"
+
+    def _armar(self, forma):
+        con_curso, forma_ids, con_cursor = forma
+        trozos = []
+        for parte in self.partes:
+            if isinstance(parte, str):
+                trozos.append(parte)
+            elif parte[0] == CURSO:
+                trozos.append("%s")
+            elif parte[0] == CURSO_ID:
+                trozos.append(self._filtro_ids(forma_ids))
+            elif parte[0] == CURSO_IGUAL:
+                trozos.append(f"{parte[1]}IN {self._filtro_ids(forma_ids)}" if con_curso else f"{parte[1]}= %s")
+            elif con_cursor and self.keyset:
+                trozos.append(f"{self.keyset['columna']} {'<' if self.keyset.get('desc') else '>'} %s")
+            else:
+                trozos.append("1 = 1")
+        sql = "".join(trozos).rstrip().rstrip(";")
+        if not self.tiene_limit:
+            # Con cursor el WHERE ya salta las páginas anteriores; sin cursor
+            # (primera página o cliente que pide page=N) se pagina con OFFSET
+            sql += " LIMIT %s" if con_cursor and self.usa_keyset else " LIMIT %s OFFSET %s"
+        # setdefault: si dos hilos arman la misma forma, todos usan el mismo objeto
+        return self._formas.setdefault(forma, sql)
+
+    def preparar(self, curso, page, size, cursor=None, resolver_ids=None):
+        """(sql, params, tiene_limit) listos para ejecutar"""
+        ids = None
+        if curso and self.usa_curso_id and resolver_ids is not None:
+            ids = resolver_ids(curso)
+        con_cursor = cursor is not None and cursor != "" and self.keyset is not None
+        forma = (bool(curso), (len(ids) if ids else 0) if curso else None, con_cursor)
+
+        params = []
+        for parte in self.partes:
+            if isinstance(parte, str):
+                continue
+            tipo = parte[0]
+            if tipo == KEYSET:
+                if con_cursor:
+                    params.append(cursor)
+            elif curso:
+                if tipo == CURSO:
+                    params.append(curso)
+                else:
+                    params.extend(ids or (curso,))
+
+        if not self.tiene_limit:
+            params.append(size)
+            if not (con_cursor and self.usa_keyset):
+                params.append((page - 1) * size)
+
+        sql = self._formas.get(forma) or self._armar(forma)
+        return sql, params, self.tiene_limit
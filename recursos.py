@@ -0,0 +1,97 @@
+"""
+Recursos pesados con inicialización perezosa (modelo de embeddings, cliente
+OpenAI, pools de MySQL) y registro de tiempos de arranque por componente.
+
+Cada recurso se construye en el primer uso, una sola vez aunque lo pidan
+varios hilos a la vez. Los marcados `por_proceso` (sockets, conexiones) se
+descartan después de un fork para que cada worker de Gunicorn arme los
+suyos; el resto (p. ej. los pesos del modelo cargados con preload_app) se
+comparte copy-on-write con los workers.
+"""
+
+import time
+import threading
+
+_tiempos = {}
+_tiempos_lock = threading.Lock()
+_recursos = []
+
+
+def registrar_tiempo(componente, segundos):
+    with _tiempos_lock:
+        _tiempos[componente] = _tiempos.get(componente, 0.0) + segundos
+
+
+class medir:
+    """Context manager: suma el tiempo del bloque al componente"""
+
+    def __init__(self, componente):
+        self.componente = componente
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar_tiempo(self.componente, time.perf_counter() - self._t0)
+        return False
+
+
+class Perezoso:
+    def __init__(self, nombre, fabrica, por_proceso=False):
+        self.nombre = nombre
+        self._fabrica = fabrica
+        self.por_proceso = por_proceso
+        self._valor = None
+        self._listo = False
+        self._lock = threading.Lock()
+        _recursos.append(self)
+
+    @property
+    def cargado(self):
+        return self._listo
+
+    def obtener(self):
+        if self._listo:
+            return self._valor
+        with self._lock:
+            if not self._listo:
+                t0 = time.perf_counter()
+                self._valor = self._fabrica()
+                dt = time.perf_counter() - t0
+                registrar_tiempo(self.nombre, dt)
+                print(f"⏱️ {self.nombre} listo en {dt:.2f} s")
+                self._listo = True
+        return self._valor
+
+    def descartar(self):
+        with self._lock:
+            self._valor = None
+            self._listo = False
+
+
+def reiniciar_tras_fork():
+    """Descarta los recursos por proceso heredados del master (hook post_fork)"""
+    for recurso in _recursos:
+        if recurso.por_proceso:
+            # Locks heredados pueden haber quedado tomados por otro hilo del master
+            recurso._lock = threading.Lock()
+            recurso.descartar()
+
+
+def informe_arranque():
+    with _tiempos_lock:
+        tiempos = dict(_tiempos)
+    return {
+        "componentes": {k: round(v, 4) for k, v in sorted(tiempos.items(), key=lambda kv: -kv[1])},
+        "cargados": [r.nombre for r in _recursos if r.cargado],
+        "pendientes": [r.nombre for r in _recursos if not r.cargado],
+    }
+
+
+def imprimir_informe(titulo="Arranque"):
+    informe = informe_arranque()
+    partes = [f"{k} {v:.2f}s" for k, v in informe["componentes"].items()]
+    print(f"⏱️ {titulo}: " + (", ".join(partes) or "sin datos"))
+    if informe["pendientes"]:
+        print(f"💤 Carga diferida: {', '.join(informe['pendientes'])}")
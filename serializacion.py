@@ -0,0 +1,146 @@
+"""
+Serialización de resultados SQL para las respuestas JSON.
+
+Todas las filas de un resultado comparten las mismas columnas, así que el
+renombrado y la conversión se deciden una vez por conjunto de columnas (plan)
+y no por celda. Con cursor.description se sabe además qué columnas no pueden
+traer Decimal/datetime y se copian tal cual.
+"""
+
+from decimal import Decimal
+from datetime import datetime
+from functools import lru_cache
+
+MODULO_TRAD = {"forum": "Foro", "assign": "Tarea", "resource": "Archivo", "quiz": "Cuestionario"}
+TRADUCCION_COLUMNAS = {
+    "firstname": "Nombre", "lastname": "Apellido", "message": "Mensaje",
+    "fecha": "Fecha", "finalgrade": "Nota", "promedio": "Promedio",
+    "fullname": "Curso", "ultima_conexion": "Última conexión",
+    "primera_conexion": "Primera conexión", "accesos": "Cantidad de accesos",
+    "tipo_recurso": "Tipo de recurso", "cantidad": "Cantidad",
+    "duedate": "Fecha de Finalización"
+}
+CLAVES_FECHA = ("fecha", "time", "conexion", "due", "duedate", "created")
+
+# Códigos de tipo de MySQL (mysql.connector.FieldType) que llegan como Decimal/datetime
+_TIPOS_A_CONVERTIR = {0, 7, 12, 246}   # DECIMAL, TIMESTAMP, DATETIME, NEWDECIMAL
+
+# A partir de este tamaño se convierte por columnas en lugar de por filas
+UMBRAL_COLUMNAR = 256
+
+_FORMATO_FECHA = "%d/%m/%Y %H:%M"
+
+
+# === Conversores por columna ===
+def _generico(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, datetime):
+        return v.strftime(_FORMATO_FECHA)
+    return v
+
+def _fecha(v):
+    if isinstance(v, Decimal):
+        v = float(v)
+    if isinstance(v, (int, float)):
+        try:
+            return datetime.fromtimestamp(v).strftime(_FORMATO_FECHA)
+        except Exception:
+            return v
+    if isinstance(v, datetime):
+        return v.strftime(_FORMATO_FECHA)
+    return v
+
+def _modulo(v):
+    v = _generico(v)
+    return MODULO_TRAD.get(str(v).lower(), v)
+
+
+def tipos_columnas(description):
+    """((columna, código de tipo), ...) a partir de cursor.description; hashable para el plan"""
+    if not description:
+        return None
+    return tuple((col[0], col[1]) for col in description)
+
+
+class PlanColumnas:
+    """Columna original, clave traducida y conversor (None = se copia tal cual)"""
+    __slots__ = ("originales", "claves", "conversores")
+
+    def __init__(self, columnas, tipos=None):
+        tipos = dict(tipos or ())
+        originales, claves, conversores = [], [], []
+        for k in columnas:
+            key = "cantidad" if isinstance(k, str) and "count" in k.lower() else k
+            es_fecha = isinstance(key, str) and any(t in key.lower() for t in CLAVES_FECHA)
+            key_esp = TRADUCCION_COLUMNAS.get(key, key)
+
+            if es_fecha:
+                conversor = _fecha
+            elif key_esp == "Tipo de recurso":
+                conversor = _modulo
+            elif k in tipos and tipos[k] not in _TIPOS_A_CONVERTIR:
+                conversor = None
+            else:
+                conversor = _generico
+
+            originales.append(k)
+            claves.append(key_esp)
+            conversores.append(conversor)
+        self.originales = tuple(originales)
+        self.claves = tuple(claves)
+        self.conversores = tuple(conversores)
+
+    def aplicar(self, filas):
+        if len(filas) >= UMBRAL_COLUMNAR:
+            return self._por_columnas(filas)
+        pares = tuple(zip(self.originales, self.conversores))
+        claves = self.claves
+        return [
+            dict(zip(claves, [fila[k] if c is None else c(fila[k]) for k, c in pares]))
+            for fila in filas
+        ]
+
+    def _columnas(self, filas):
+        columnas = []
+        for k, conversor in zip(self.originales, self.conversores):
+            valores = [fila[k] for fila in filas]
+            columnas.append(valores if conversor is None else list(map(conversor, valores)))
+        return columnas
+
+    def _por_columnas(self, filas):
+        claves = self.claves
+        return [dict(zip(claves, valores)) for valores in zip(*self._columnas(filas))]
+
+    def listas(self, filas):
+        """Filas como listas en el orden de `claves` (formato compacto)"""
+        if len(filas) >= UMBRAL_COLUMNAR:
+            return [list(valores) for valores in zip(*self._columnas(filas))]
+        pares = tuple(zip(self.originales, self.conversores))
+        return [[fila[k] if c is None else c(fila[k]) for k, c in pares] for fila in filas]
+
+
+@lru_cache(maxsize=512)
+def plan_para(columnas, tipos=None) -> PlanColumnas:
+    return PlanColumnas(columnas, tipos)
+
+
+def serializar_resultado(data, tipos=None):
+    """
+    Filas (dicts de cursor.dictionary) -> filas con claves en español y
+    valores listos para JSON. `tipos` es el resultado de tipos_columnas().
+    """
+    if not data:
+        return []
+    return plan_para(tuple(data[0]), tipos).aplicar(data)
+
+
+def serializar_columnas(data, tipos=None):
+    """
+    Formato compacto: {"columns": [...], "rows": [[...], ...]}. Los nombres de
+    columna van una sola vez en lugar de repetirse en cada fila.
+    """
+    if not data:
+        return {"columns": [], "rows": []}
+    plan = plan_para(tuple(data[0]), tipos)
+    return {"columns": list(plan.claves), "rows": plan.listas(data)}
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Servidor local de embeddings (sidecar) compartido por los workers.
+
+Un único proceso tiene el modelo y el índice del catálogo y atiende por un
+socket Unix. Las consultas que llegan juntas se codifican en un mismo lote:
+el primer pedido abre una ventana de EMBED_LOTE_MS milisegundos (o hasta
+EMBED_LOTE_MAX textos) y todo lo acumulado va en una sola llamada a encode.
+Así la memoria pasa de N copias del modelo (una por worker) a una sola.
+
+Protocolo: mensajes JSON con un prefijo de 4 bytes (longitud, big-endian).
+    {"op": "ping"}
+    {"op": "asegurar", "version": ..., "textos": [...]}
+    {"op": "buscar", "version": ..., "texto": ..., "candidatos": [...], "top_k": 5}
+
+Lo arranca gunicorn.conf.py con EMBED_SIDECAR=1; también se puede correr a mano:
+    python servidor_embeddings.py --socket .cache/embeddings.sock
+"""
+
+import os
+import json
+import time
+import queue
+import socket
+import signal
+import struct
+import argparse
+import threading
+import socketserver
+from concurrent.futures import Future
+
+_CABECERA = struct.Struct(">I")
+MAX_MENSAJE = 64 * 1024 * 1024
+
+
+def ruta_socket_defecto():
+    cache_dir = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+    return os.getenv("EMBED_SOCKET", os.path.join(cache_dir, "embeddings.sock"))
+
+
+# === Protocolo ===
+def _recibir_exacto(sock, n):
+    partes = []
+    while n:
+        parte = sock.recv(n)
+        if not parte:
+            raise ConnectionError("Conexión cerrada")
+        partes.append(parte)
+        n -= len(parte)
+    return b"".join(partes)
+
+def enviar(sock, mensaje):
+    crudo = json.dumps(mensaje, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_CABECERA.pack(len(crudo)) + crudo)
+
+def recibir(sock):
+    (largo,) = _CABECERA.unpack(_recibir_exacto(sock, _CABECERA.size))
+    if largo > MAX_MENSAJE:
+        raise ValueError("Mensaje demasiado grande")
+    return json.loads(_recibir_exacto(sock, largo).decode("utf-8"))
+
+
+# === Cliente (workers) ===
+class ClienteEmbeddings:
+    """
+    Cliente usado por foro.py. Devuelve None ante cualquier falla del sidecar
+    para que el llamador use el modelo local; después de una falla no se
+    reintenta hasta pasados `espera_reintento` segundos.
+    """
+
+    def __init__(self, ruta, timeout=2.0, timeout_indice=120.0, espera_reintento=10.0):
+        self.ruta = ruta
+        self.timeout = timeout
+        self.timeout_indice = timeout_indice
+        self.espera_reintento = espera_reintento
+        self._local = threading.local()
+        self._caido_hasta = 0.0
+
+    def _cerrar(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _pedir(self, mensaje, timeout=None):
+        if time.monotonic() < self._caido_hasta:
+            return None
+        for intento in range(2):
+            try:
+                sock = getattr(self._local, "sock", None)
+                if sock is None:
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.settimeout(self.timeout)
+                    sock.connect(self.ruta)
+                    self._local.sock = sock
+                sock.settimeout(timeout or self.timeout)
+                enviar(sock, mensaje)
+                return recibir(sock)
+            except (OSError, ValueError, ConnectionError) as e:
+                # Conexión vieja (sidecar reiniciado): un reintento con conexión nueva
+                self._cerrar()
+                if intento:
+                    print(f"⚠️ Sidecar de embeddings no disponible ({e}); se usa el modelo local")
+                    self._caido_hasta = time.monotonic() + self.espera_reintento
+        return None
+
+    def ping(self):
+        return self._pedir({"op": "ping"})
+
+    def buscar(self, texto, candidatos, top_k, version, textos_catalogo):
+        """[(posición, score)] o None si hay que resolver localmente"""
+        pedido = {"op": "buscar", "version": version, "texto": texto,
+                  "candidatos": candidatos, "top_k": top_k}
+        respuesta = self._pedir(pedido)
+        if respuesta and respuesta.get("error") == "version":
+            # El sidecar todavía no tiene esta versión del catálogo
+            if self._pedir({"op": "asegurar", "version": version, "textos": textos_catalogo()},
+                           timeout=self.timeout_indice) is None:
+                return None
+            respuesta = self._pedir(pedido)
+        if not respuesta or "top" not in respuesta:
+            if respuesta and respuesta.get("error"):
+                print(f"⚠️ Sidecar de embeddings: {respuesta['error']}")
+            return None
+        return [(int(i), float(score)) for i, score in respuesta["top"]]
+
+
+# === Servidor (sidecar) ===
+class Lotes:
+    """Junta los textos que llegan dentro de la ventana y los codifica juntos"""
+
+    def __init__(self, codificar, ventana=0.005, maximo=64):
+        self._codificar = codificar
+        self.ventana = ventana
+        self.maximo = maximo
+        self._cola = queue.Queue()
+        self.lotes = 0
+        self.textos = 0
+        self.lote_maximo = 0
+        threading.Thread(target=self._bucle, name="lotes-embeddings", daemon=True).start()
+
+    def codificar(self, textos):
+        futuro = Future()
+        self._cola.put((list(textos), futuro))
+        return futuro.result()
+
+    def _bucle(self):
+        while True:
+            pendientes = [self._cola.get()]
+            cantidad = len(pendientes[0][0])
+            limite = time.monotonic() + self.ventana
+            while cantidad < self.maximo:
+                resto = limite - time.monotonic()
+                if resto <= 0:
+                    break
+                try:
+                    item = self._cola.get(timeout=resto)
+                except queue.Empty:
+                    break
+                pendientes.append(item)
+                cantidad += len(item[0])
+
+            textos = [t for lote, _ in pendientes for t in lote]
+            try:
+                vectores = self._codificar(textos)
+            except Exception as e:
+                for _, futuro in pendientes:
+                    futuro.set_exception(e)
+                continue
+
+            self.lotes += 1
+            self.textos += len(textos)
+            self.lote_maximo = max(self.lote_maximo, len(textos))
+            inicio = 0
+            for lote, futuro in pendientes:
+                futuro.set_result(vectores[inicio:inicio + len(lote)])
+                inicio += len(lote)
+
+
+class _Manejador(socketserver.BaseRequestHandler):
+    def handle(self):
+        servidor = self.server
+        while True:
+            try:
+                pedido = recibir(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                respuesta = servidor.atender(pedido)
+            except Exception as e:
+                respuesta = {"error": str(e)}
+            try:
+                enviar(self.request, respuesta)
+            except OSError:
+                return
+
+
+class ServidorEmbeddings(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, ruta, indice, lotes):
+        self.indice = indice
+        self.lotes = lotes
+        self.inicio = time.time()
+        super().__init__(ruta, _Manejador)
+
+    def atender(self, pedido):
+        op = pedido.get("op")
+        if op == "ping":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.inicio, 1),
+                "indice": self.indice.version,
+                "lotes": self.lotes.lotes,
+                "textos": self.lotes.textos,
+                "lote_maximo": self.lotes.lote_maximo,
+            }
+        if op == "asegurar":
+            self.indice.asegurar(pedido["version"], pedido.get("textos") or [])
+            return {"ok": True}
+        if op == "buscar":
+            if self.indice.version != f"{self.indice.nombre_modelo}:{pedido.get('version')}":
+                return {"error": "version"}
+            top = self.indice.buscar(pedido.get("texto", ""), pedido.get("candidatos") or [],
+                                     top_k=int(pedido.get("top_k", 10)))
+            return {"top": top}
+        return {"error": f"Operación desconocida: {op}"}
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path="/home/asistenteia/.env")
+
+    from embeddings import resolver_backend, identificador, cargar_modelo
+    from indice_semantico import IndiceSemantico
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=ruta_socket_defecto())
+    args = parser.parse_args()
+
+    nombre = "paraphrase-multilingual-MiniLM-L12-v2"
+    backend, archivo = resolver_backend(os.getenv("EMBED_BACKEND", "torch"), os.getenv("EMBED_ONNX_ARCHIVO"))
+    t0 = time.perf_counter()
+    modelo = cargar_modelo(nombre, backend, archivo)
+    print(f"🧠 Sidecar de embeddings: modelo ({backend}) cargado en {time.perf_counter() - t0:.2f} s")
+
+    lotes = Lotes(
+        lambda textos: modelo.encode(textos, convert_to_numpy=True, normalize_embeddings=True),
+        ventana=float(os.getenv("EMBED_LOTE_MS", "5")) / 1000,
+        maximo=int(os.getenv("EMBED_LOTE_MAX", "64")),
+    )
+    cache_dir = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+    indice = IndiceSemantico(lotes.codificar, os.path.join(cache_dir, "embeddings"),
+                             identificador(nombre, backend, archivo))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    servidor = ServidorEmbeddings(args.socket, indice, lotes)
+    os.chmod(args.socket, 0o600)
+
+    def _terminar(*_):
+        threading.Thread(target=servidor.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, _terminar)
+    signal.signal(signal.SIGINT, _terminar)
+
+    print(f"🔌 Sidecar de embeddings escuchando en {args.socket}")
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.server_close()
+        try:
+            os.unlink(args.socket)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -19,8 +19,10 @@ function getClave() {
 // Cursos y Preguntas Sugeridas
 // =========================
 function cargarCursos() {
+  // no-cache: el navegador revalida con If-None-Match y reusa su copia ante un 304
   fetch("/curso/listar", {
-    headers: { "x-pass": getClave() }
+    headers: { "x-pass": getClave() },
+    cache: "no-cache"
   })
     .then(res => res.json())
     .then(cursos => {
@@ -45,6 +47,70 @@ function cargarCursos() {
     .catch(err => console.error("❌ Error al cargar cursos:", err));
 }
 
+// =========================
+// Buscador de cursos (typeahead)
+// =========================
+let temporizadorBusqueda = null;
+let busquedaEnCurso = null;
+
+function buscarCursos(q) {
+  // Sólo importa la última búsqueda: la anterior se cancela
+  if (busquedaEnCurso) busquedaEnCurso.abort();
+  busquedaEnCurso = new AbortController();
+  return fetch(`/curso/buscar?q=${encodeURIComponent(q)}&limite=20`, {
+    headers: { "x-pass": getClave() },
+    signal: busquedaEnCurso.signal
+  }).then(res => res.json());
+}
+
+function elegirCurso(nombre) {
+  const select = document.getElementById("curso");
+  if (![...select.options].some(o => o.value === nombre)) {
+    const option = document.createElement("option");
+    option.value = nombre;
+    option.textContent = nombre;
+    select.appendChild(option);
+  }
+  select.value = nombre;
+  select.dispatchEvent(new Event("change"));
+}
+
+function initBuscadorCursos() {
+  const input = document.getElementById("buscar-curso");
+  const lista = document.getElementById("cursos-sugeridos");
+  if (!input || !lista) return;
+
+  input.addEventListener("input", () => {
+    const q = input.value.trim();
+    clearTimeout(temporizadorBusqueda);
+
+    // Se eligió una sugerencia
+    if ([...lista.options].some(o => o.value === q)) {
+      elegirCurso(q);
+      return;
+    }
+    if (q.length < 2) {
+      lista.innerHTML = "";
+      return;
+    }
+
+    temporizadorBusqueda = setTimeout(() => {
+      buscarCursos(q)
+        .then(resultados => {
+          lista.innerHTML = "";
+          resultados.forEach(r => {
+            const option = document.createElement("option");
+            option.value = r.curso;
+            lista.appendChild(option);
+          });
+        })
+        .catch(err => {
+          if (err.name !== "AbortError") console.error("❌ Error al buscar cursos:", err);
+        });
+    }, 200);
+  });
+}
+
 function cargarPreguntasSegunCurso() {
   fetch("/foro/faq", {
     headers: { "x-pass": getClave() }
@@ -76,6 +142,90 @@ function cargarPreguntasSegunCurso() {
     .catch(err => console.error("❌ Error al cargar preguntas frecuentes:", err));
 }
 
+// =========================
+// Lectura de respuestas (JSON o NDJSON en streaming)
+// =========================
+async function leerNDJSON(res, onEvento) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let idx;
+    while ((idx = buffer.indexOf("\n")) >= 0) {
+      const linea = buffer.slice(0, idx).trim();
+      buffer = buffer.slice(idx + 1);
+      if (linea) onEvento(JSON.parse(linea));
+    }
+  }
+  if (buffer.trim()) onEvento(JSON.parse(buffer));
+}
+
+// Devuelve el JSON final; si el backend responde en streaming, va
+// renderizando el análisis IA o la tabla a medida que llegan los datos.
+async function leerRespuesta(res) {
+  const tipo = res.headers.get("Content-Type") || "";
+  if (!tipo.includes("application/x-ndjson") || !res.body) {
+    return res.json();
+  }
+
+  let data = null;
+  let texto = "";
+  let columnas = null;
+  let filas = [];
+  let fin = {};
+  let pendiente = false;
+  const armar = () =>
+    data.ia
+      ? { ...data, respuesta: [{ "Análisis IA": texto || "…" }] }
+      : {
+          ...data,
+          respuesta: columnas ? { columns: columnas, rows: filas } : filas,
+          count: filas.length,
+          ...fin
+        };
+  const pintar = () => {
+    pendiente = false;
+    if (data) renderRespuesta(armar());
+  };
+  const programar = () => {
+    if (!pendiente) {
+      pendiente = true;
+      requestAnimationFrame(pintar);
+    }
+  };
+
+  await leerNDJSON(res, evento => {
+    if (evento.tipo === "meta") {
+      const { tipo: _t, ...meta } = evento;
+      data = meta;
+      if (data.ia) pintar();
+    } else if (evento.tipo === "delta") {
+      texto += evento.texto;
+      programar();
+    } else if (evento.tipo === "filas") {
+      if (evento.columns) {
+        columnas = evento.columns;
+        filas = filas.concat(evento.rows);
+      } else {
+        filas = filas.concat(evento.filas);
+      }
+      programar();
+    } else if (evento.tipo === "fin") {
+      const { tipo: _t, ...resto } = evento;
+      fin = resto;
+    } else if (evento.tipo === "error") {
+      data = { status: "error", message: evento.message };
+    }
+  });
+
+  if (!data) return { status: "error", message: "Respuesta vacía del servidor" };
+  if (data.status !== "ok") return data;
+  return data.ia ? { ...data, respuesta: [{ "Análisis IA": texto }] } : armar();
+}
+
 // =========================
 // Enviar y Limpiar
 // =========================
@@ -116,7 +266,9 @@ function enviarPregunta() {
     libre,
     page: state.page,
     size: state.size,
-    consentIA: state.consentIA
+    consentIA: state.consentIA,
+    stream: true,
+    formato: "columnas"
   };
   state.lastPayload = payload;
 
@@ -128,7 +280,7 @@ function enviarPregunta() {
     },
     body: JSON.stringify(payload)
   })
-    .then(res => res.json())
+    .then(leerRespuesta)
     .then(data => {
       if (data.status === "sugerencias") {
         let html = `<div class="alerta-vacia">🤖 No encontré coincidencia exacta. Estas son las preguntas más cercanas:</div><ul>`;
@@ -187,7 +339,9 @@ window.ejecutarSugerencia = function (idx) {
     seleccion: idx + 1,
     sugerencias: state.chatSugerencias,
     page: state.page,
-    size: state.size
+    size: state.size,
+    stream: true,
+    formato: "columnas"
   };
 
   const resp = document.getElementById("respuesta");
@@ -201,7 +355,7 @@ window.ejecutarSugerencia = function (idx) {
     },
     body: JSON.stringify(payload)
   })
-    .then(r => r.json())
+    .then(leerRespuesta)
     .then(data => renderRespuesta(data))
     .catch(err => {
       console.error("❌ Error al ejecutar sugerencia:", err);
@@ -233,6 +387,7 @@ function limpiar() {
 document.addEventListener("DOMContentLoaded", () => {
   initEticaUI();
   cargarCursos();
+  initBuscadorCursos();
   document.getElementById("curso").addEventListener("change", () => {
     state.page = 1;
     cargarPreguntasSegunCurso();
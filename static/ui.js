@@ -96,7 +96,7 @@ export function renderRespuesta(data) {
   }
 
   // ✅ Caso normal: tabla
-  if (data.respuesta && data.respuesta.length > 0) {
+  if (cantidadFilas(data.respuesta) > 0) {
     const tabla = generarTabla(data.respuesta);
     const meta = renderMeta(data);
     respuestaEl.innerHTML = `${meta}${tabla}${buildEticaFooter(data)}`;
@@ -105,22 +105,31 @@ export function renderRespuesta(data) {
   }
 }
 
+// La respuesta tabular llega como lista de objetos o, en formato compacto,
+// como { columns: [...], rows: [[...]] }
+export function cantidadFilas(respuesta) {
+  if (!respuesta) return 0;
+  return Array.isArray(respuesta) ? respuesta.length : (respuesta.rows || []).length;
+}
+
 export function generarTabla(respuesta) {
-  if (!respuesta || respuesta.length === 0) return "";
-  const columnas = Object.keys(respuesta[0]);
-  let html = "<table><thead><tr>";
-  columnas.forEach(col => { html += `<th>${escapeHtml(col)}</th>`; });
-  html += "</tr></thead><tbody>";
-  respuesta.forEach(fila => {
-    html += "<tr>";
-    columnas.forEach(col => {
-      const val = fila[col] ?? "";
-      html += `<td>${escapeHtml(String(val))}</td>`;
+  if (cantidadFilas(respuesta) === 0) return "";
+  const compacta = !Array.isArray(respuesta);
+  const columnas = compacta ? respuesta.columns : Object.keys(respuesta[0]);
+  const filas = compacta ? respuesta.rows : respuesta;
+  const partes = ["<table><thead><tr>"];
+  columnas.forEach(col => { partes.push(`<th>${escapeHtml(col)}</th>`); });
+  partes.push("</tr></thead><tbody>");
+  filas.forEach(fila => {
+    partes.push("<tr>");
+    columnas.forEach((col, i) => {
+      const val = (compacta ? fila[i] : fila[col]) ?? "";
+      partes.push(`<td>${escapeHtml(String(val))}</td>`);
     });
-    html += "</tr>";
+    partes.push("</tr>");
   });
-  html += "</tbody></table>";
-  return html;
+  partes.push("</tbody></table>");
+  return partes.join("");
 }
 
 export function buildEticaFooter(data) {
@@ -134,7 +143,7 @@ export function buildEticaFooter(data) {
 export function renderMeta(data) {
   const page = data.page ?? state.page;
   const size = data.size ?? state.size;
-  const count = data.count ?? (data.respuesta ? data.respuesta.length : 0);
+  const count = data.count ?? cantidadFilas(data.respuesta);
   const ruta = data.ruta ? ` · fuente: <code>${escapeHtml(data.ruta)}</code>` : "";
   return `
     <div class="meta-consulta">
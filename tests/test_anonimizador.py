@@ -0,0 +1,87 @@
+"""Matcher compilado del anonimizador contra el reemplazo secuencial anterior"""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anonimizador import (  # noqa: E402
+    DesanonimizadorIncremental,
+    Reemplazador,
+    anonimizar_hilos,
+    desanonimizar,
+)
+from bench_anonimizacion import generar_foro, limpiar, mapa_de_reemplazos, reemplazo_secuencial  # noqa: E402
+
+MENSAJES = [
+    {"firstname": "Ana", "lastname": "María Pérez", "message": "Hola, soy Ana María y firmo ANA PÉREZ", "tema": "T1"},
+    {"firstname": "Ana", "lastname": "Paz", "message": "ana, ana maría y Ana Paz no son la misma", "tema": "T1"},
+    {"firstname": "Matías", "lastname": "Núñez", "message": "Mati, Matias y MATÍAS nuñez: Matíasito no", "tema": "T2"},
+    {"firstname": "Camila", "lastname": "Ríos", "message": "cami rios, Cámila y camila.ríos@x.com", "tema": "T2"},
+    {"firstname": "Juan", "lastname": "Juana", "message": "Juana le contesta a Juan; juan juana juanita", "tema": "T3"},
+]
+
+TEXTOS = [
+    "Ana María Pérez, ana maria perez y Ana-María",
+    "Matías Núñez dijo que mati vendría con Camila Ríos",
+    "sin nombres propios en este mensaje",
+    "Juan Juana, JUAN y Juanito",
+]
+
+
+@pytest.mark.parametrize("texto", [m["message"] for m in MENSAJES] + TEXTOS)
+def test_mismo_resultado_que_el_reemplazo_secuencial(texto):
+    mapa = mapa_de_reemplazos(MENSAJES)
+    assert Reemplazador(mapa).reemplazar(texto) == reemplazo_secuencial(texto, mapa)
+
+
+def test_foro_sintetico():
+    mensajes = generar_foro(120, 40, semilla=7)
+    mapa = mapa_de_reemplazos(mensajes)
+    reemplazador = Reemplazador(mapa)
+    for m in mensajes:
+        texto = limpiar(m["message"])
+        assert reemplazador.reemplazar(texto) == reemplazo_secuencial(texto, mapa)
+
+
+def test_anonimizar_hilos_no_deja_nombres():
+    hilos, mapa_inverso, _ = anonimizar_hilos(MENSAJES)
+    texto = "\n".join(linea for lineas in hilos.values() for linea in lineas)
+    for nombre in ("Ana", "María", "Pérez", "Matías", "Mati", "Núñez", "Camila", "cami", "Juan", "Juana"):
+        assert not re.search(rf"(?<!\w){nombre}(?!\w)", texto, re.IGNORECASE), nombre
+    # Sólo palabras completas: "Matíasito" y "juanita" no son nombres de la lista
+    assert "Matíasito" in texto and "juanita" in texto
+    assert mapa_inverso["Usuario_1"] == "Ana María Pérez"
+    assert set(mapa_inverso) == {f"Usuario_{i}" for i in range(1, 6)}
+
+
+def _respuesta_ia(mapa_inverso):
+    return " ".join(f"{p} ({i})." for i, p in enumerate(sorted(mapa_inverso), 1)) + " Usuario_99 no existe."
+
+
+def test_desanonimizar_restaura_los_pseudonimos():
+    _, mapa_inverso, _ = anonimizar_hilos(MENSAJES)
+    texto = _respuesta_ia(mapa_inverso)
+    esperado = texto
+    for pseudonimo, nombre in mapa_inverso.items():
+        esperado = esperado.replace(f"{pseudonimo} ", f"{nombre} ")
+    assert desanonimizar(texto, mapa_inverso) == esperado
+    assert "Usuario_99" in esperado
+
+
+def test_desanonimizador_incremental_con_pseudonimos_partidos():
+    _, mapa_inverso, _ = anonimizar_hilos(MENSAJES)
+    texto = _respuesta_ia(mapa_inverso)
+    esperado = desanonimizar(texto, mapa_inverso)
+    # Cortes en cada posición: el pseudónimo puede quedar partido en cualquier lugar
+    for corte in range(1, len(texto)):
+        incremental = DesanonimizadorIncremental(mapa_inverso)
+        salida = incremental.agregar(texto[:corte]) + incremental.agregar(texto[corte:]) + incremental.cerrar()
+        assert salida == esperado, corte
+    # Fragmentos de a un carácter, como puede mandarlos el streaming
+    incremental = DesanonimizadorIncremental(mapa_inverso)
+    salida = "".join(incremental.agregar(c) for c in texto) + incremental.cerrar()
+    assert salida == esperado
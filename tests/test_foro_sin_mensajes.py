@@ -0,0 +1,38 @@
+"""Análisis IA sobre filas que no traen el campo `message`"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_PREFIX", "mdl_")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import foro  # noqa: E402
+
+FILAS = [{"firstname": "Ana", "lastname": "Pérez", "discussion": 1}] * 3
+
+
+@pytest.fixture
+def sin_ia(monkeypatch):
+    def _llamar_ia(*args, **kwargs):
+        raise AssertionError("no debería llamarse a la IA sin mensajes")
+    monkeypatch.setattr(foro, "_llamar_ia", _llamar_ia)
+
+
+def test_filas_sin_message_no_arman_chunks():
+    chunks, _, _ = foro._preparar_analisis("Resumí el foro", FILAS)
+    assert chunks == []
+
+
+def test_procesar_sin_message(sin_ia):
+    assert foro.procesar_pregunta_ia("Resumí el foro", FILAS) == foro.SIN_MENSAJES
+
+
+def test_procesar_stream_sin_message(sin_ia):
+    assert list(foro.procesar_pregunta_ia_stream("Resumí el foro", FILAS)) == [foro.SIN_MENSAJES]
+
+
+def test_prompt_final_sin_chunks():
+    assert "Resumí el foro" in foro._prompt_final("Resumí el foro", [])
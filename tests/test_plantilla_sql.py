@@ -0,0 +1,123 @@
+"""PlantillaSQL.preparar contra la preparación anterior por reemplazo de texto"""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_PREFIX", "mdl_")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import foro  # noqa: E402
+from plantilla_sql import PlantillaSQL  # noqa: E402
+
+PREFIJO = "mdl_"
+IDS = {"Física": [5], "Química": [7, 9]}
+
+
+def ids_curso(curso):
+    return IDS.get(curso)
+
+
+def preparar_anterior(sql_raw, curso, page, size, keyset=None, cursor=None):
+    """_prepare_sql_and_params de foro.py antes de las plantillas (con OFFSET cuando no hay cursor)"""
+    if not sql_raw:
+        return "", [], False
+    sql = sql_raw.replace("{PREFIX}", PREFIJO).strip()
+    params = []
+    usar_keyset = bool(keyset and keyset.get("columna") and "__KEYSET__" in sql
+                       and cursor is not None and cursor != "")
+
+    if curso:
+        sql = re.sub(r"(\b(?:\w+\.)?course\s*)=\s*(?:(['\"])__CURSO__\2|\b__CURSO__\b)",
+                     r"\1IN __CURSO_ID__", sql, flags=re.IGNORECASE)
+
+    def _placeholder(m):
+        marca = m.group(0)
+        if marca == "__KEYSET__":
+            if not usar_keyset:
+                return "1 = 1"
+            params.append(cursor)
+            return f"{keyset['columna']} {'<' if keyset.get('desc') else '>'} %s"
+        if marca == "__CURSO_ID__":
+            if not curso:
+                return "(NULL)"
+            ids = ids_curso(curso)
+            if ids:
+                params.extend(ids)
+                return "(" + ", ".join(["%s"] * len(ids)) + ")"
+            params.append(curso)
+            return f"(SELECT id FROM {PREFIJO}course WHERE fullname = %s)"
+        if curso:
+            params.append(curso)
+        return "%s"
+
+    sql = re.sub(r"(['\"])__CURSO__\1|\b__CURSO__\b|\b__CURSO_ID__\b|\b__KEYSET__\b", _placeholder, sql)
+
+    has_limit = bool(re.search(r"\blimit\s+\d+", sql, flags=re.IGNORECASE))
+    if has_limit:
+        # La plantilla también quita el ";" final cuando la SQL ya trae LIMIT
+        sql = sql.rstrip().rstrip(";")
+    elif usar_keyset:
+        sql = sql.rstrip(";") + " LIMIT %s"
+        params.append(size)
+    else:
+        sql = sql.rstrip(";") + " LIMIT %s OFFSET %s"
+        params.extend([size, (page - 1) * size])
+    return sql, params, has_limit
+
+
+EXTRAS = [
+    "SELECT * FROM {PREFIX}forum f WHERE f.course = '__CURSO__'",
+    "SELECT 1 FROM {PREFIX}x WHERE a = __CURSO__ LIMIT 5;",
+    "SELECT u.id FROM {PREFIX}user u JOIN {PREFIX}course c ON c.id = u.id WHERE c.id IN __CURSO_ID__",
+]
+
+
+def _casos():
+    snapshot = foro.catalogo.snapshot()
+    entradas = [p for p in snapshot.todas() if isinstance(p.get("sql"), str)]
+    entradas += [{"sql": sql} for sql in EXTRAS]
+    entradas.append({"sql": "SELECT u.id FROM {PREFIX}user u WHERE __KEYSET__ ORDER BY u.id DESC",
+                     "keyset": {"columna": "u.id", "campo": "id", "desc": True}})
+    return entradas
+
+
+@pytest.mark.parametrize("entrada", _casos(), ids=lambda e: e.get("pregunta", e["sql"])[:40])
+def test_equivale_a_la_preparacion_anterior(entrada):
+    keyset = foro._keyset_entrada(entrada)
+    plantilla = PlantillaSQL(entrada["sql"], PREFIJO, keyset)
+    for curso in ("", "Física", "Química", "Curso nuevo"):
+        for cursor in (None, "", 17):
+            for page in (1, 3):
+                esperado = preparar_anterior(entrada["sql"], curso, page, 50, keyset, cursor)
+                obtenido = plantilla.preparar(curso, page, 50, cursor, ids_curso)
+                assert (obtenido[0], list(obtenido[1]), obtenido[2]) == esperado, (curso, cursor, page)
+
+
+def test_misma_forma_devuelve_el_mismo_str():
+    plantilla = PlantillaSQL("SELECT * FROM {PREFIX}forum f WHERE f.course = __CURSO__", PREFIJO)
+    a = plantilla.preparar("Física", 1, 50, None, ids_curso)[0]
+    b = plantilla.preparar("Física", 4, 20, None, ids_curso)[0]
+    c = plantilla.preparar("Otro con un id", 1, 50, None, lambda _: [11])[0]
+    assert a is b is c
+    # Otra cantidad de ids es otra forma (y otra sentencia preparada)
+    assert plantilla.preparar("Química", 1, 50, None, ids_curso)[0] is not a
+    assert plantilla.preparar("", 1, 50, None, ids_curso)[0] is plantilla.preparar("", 2, 50, None, ids_curso)[0]
+
+
+def test_formas_de_keyset():
+    plantilla = PlantillaSQL(
+        "SELECT u.id FROM {PREFIX}user u WHERE __KEYSET__ ORDER BY u.id", PREFIJO, {"columna": "u.id", "campo": "id"}
+    )
+    sql, params, _ = plantilla.preparar("", 3, 10)
+    assert sql.endswith("WHERE 1 = 1 ORDER BY u.id LIMIT %s OFFSET %s")
+    assert params == [10, 20]
+
+    sql_cursor, params, _ = plantilla.preparar("", 3, 10, cursor=55)
+    assert sql_cursor.endswith("WHERE u.id > %s ORDER BY u.id LIMIT %s")
+    assert params == [55, 10]
+    assert plantilla.preparar("", 1, 10, cursor=99)[0] is sql_cursor
+    assert plantilla.preparar("", 1, 10)[0] is sql
@@ -0,0 +1,196 @@
+"""
+Trazas de latencia por etapa (fuzzy, embeddings, rerank, SQL, IA, ...).
+
+Cada etapa se mide con `tramo("nombre")`. El tiempo se suma a la traza de la
+request en curso (header Server-Timing y, con debug, campo "trazas" en la
+respuesta JSON) y a un histograma por etapa. Cada worker vuelca sus
+histogramas a CACHE_DIR/metricas/<pid>.json y /metrics los combina en
+formato de texto de Prometheus, así el scrape ve todos los workers sin
+depender de servicios externos.
+"""
+
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DIRECTORIO = os.path.join(
+    os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")),
+    "metricas",
+)
+INTERVALO_VOLCADO = float(os.getenv("METRICAS_INTERVALO", "2"))
+
+_lock = threading.Lock()
+_histogramas = {}   # (métrica, etiquetas) -> [conteos por bucket..., +Inf, suma]
+_ultimo_volcado = 0.0
+
+ETAPA = "asistente_etapa_segundos"
+PETICION = "asistente_peticion_segundos"
+AYUDA = {
+    ETAPA: "Duración de cada etapa del pipeline (fuzzy, embeddings, rerank, sql, ia, ...)",
+    PETICION: "Duración total de la request por endpoint (sin el cuerpo en streaming)",
+}
+
+
+# === Registro ===
+def observar(metrica, etiquetas, segundos):
+    clave = (metrica, tuple(sorted(etiquetas.items())))
+    with _lock:
+        h = _histogramas.get(clave)
+        if h is None:
+            h = _histogramas[clave] = [0] * (len(BUCKETS) + 1) + [0.0]
+        h[bisect_left(BUCKETS, segundos)] += 1
+        h[-1] += segundos
+
+
+def registrar_etapa(nombre, segundos):
+    observar(ETAPA, {"etapa": nombre}, segundos)
+    if has_request_context():
+        trazas = g.setdefault("trazas", {})
+        trazas[nombre] = trazas.get(nombre, 0.0) + segundos
+
+
+class tramo:
+    """Context manager que mide una etapa"""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar_etapa(self.nombre, time.perf_counter() - self._t0)
+        return False
+
+
+def trazas_actuales():
+    """{etapa: ms} de la request en curso"""
+    if not has_request_context():
+        return {}
+    return {k: round(v * 1000, 2) for k, v in g.get("trazas", {}).items()}
+
+
+# === Hooks de Flask ===
+def iniciar_peticion():
+    g.t_peticion = time.perf_counter()
+
+
+def debug_pedido():
+    if request.headers.get("X-Debug") == "1":
+        return True
+    datos = request.get_json(silent=True) if request.is_json else None
+    return isinstance(datos, dict) and bool(datos.get("debug"))
+
+
+def cerrar_peticion(response):
+    """after_request: Server-Timing, campo de debug e histograma por endpoint"""
+    t0 = g.pop("t_peticion", None)
+    if t0 is None:
+        return response
+    total = time.perf_counter() - t0
+    observar(PETICION, {"endpoint": request.endpoint or "desconocido"}, total)
+
+    trazas = trazas_actuales()
+    partes = [f"{etapa};dur={ms}" for etapa, ms in trazas.items()]
+    partes.append(f"total;dur={round(total * 1000, 2)}")
+    response.headers["Server-Timing"] = ", ".join(partes)
+
+    if debug_pedido() and not response.is_streamed and response.is_json:
+        cuerpo = response.get_json(silent=True)
+        if isinstance(cuerpo, dict):
+            cuerpo["trazas"] = {**trazas, "total": round(total * 1000, 2)}
+            response.set_data(json.dumps(cuerpo, ensure_ascii=False, default=str))
+
+    volcar()
+    return response
+
+
+# === Persistencia por worker y exposición ===
+def volcar(forzar=False):
+    global _ultimo_volcado
+    ahora = time.monotonic()
+    if not forzar and ahora - _ultimo_volcado < INTERVALO_VOLCADO:
+        return
+    _ultimo_volcado = ahora
+    with _lock:
+        datos = [[m, list(e), h] for (m, e), h in _histogramas.items()]
+    try:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        ruta = os.path.join(DIRECTORIO, f"{os.getpid()}.json")
+        tmp = f"{ruta}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(tmp, ruta)
+    except OSError:
+        pass
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _combinar():
+    volcar(forzar=True)
+    total = {}
+    try:
+        archivos = [a for a in os.listdir(DIRECTORIO) if a.endswith(".json")]
+    except OSError:
+        archivos = []
+    for archivo in archivos:
+        ruta = os.path.join(DIRECTORIO, archivo)
+        pid = archivo[:-5]
+        if pid.isdigit() and not _vivo(int(pid)):
+            # Worker terminado (reciclado por Gunicorn): sus datos se descartan
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metrica, etiquetas, h in datos:
+            clave = (metrica, tuple(tuple(e) for e in etiquetas))
+            acumulado = total.setdefault(clave, [0] * (len(BUCKETS) + 1) + [0.0])
+            for i, v in enumerate(h):
+                acumulado[i] += v
+    return total
+
+
+def _etiquetas(pares, extra=None):
+    pares = list(pares) + ([extra] if extra else [])
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}" if pares else ""
+
+
+def texto_prometheus():
+    lineas = []
+    por_metrica = {}
+    for (metrica, etiquetas), h in sorted(_combinar().items()):
+        por_metrica.setdefault(metrica, []).append((etiquetas, h))
+    for metrica, series in por_metrica.items():
+        lineas.append(f"# HELP {metrica} {AYUDA.get(metrica, metrica)}")
+        lineas.append(f"# TYPE {metrica} histogram")
+        for etiquetas, h in series:
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS, h):
+                acumulado += conteo
+                lineas.append(f"{metrica}_bucket{_etiquetas(etiquetas, ('le', limite))} {acumulado}")
+            acumulado += h[len(BUCKETS)]
+            lineas.append(f"{metrica}_bucket{_etiquetas(etiquetas, ('le', '+Inf'))} {acumulado}")
+            lineas.append(f"{metrica}_sum{_etiquetas(etiquetas)} {h[-1]:.6f}")
+            lineas.append(f"{metrica}_count{_etiquetas(etiquetas)} {acumulado}")
+    return "\n".join(lineas) + "\n"